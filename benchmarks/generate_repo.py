@@ -0,0 +1,150 @@
+"""
+Generate synthetic repositories for benchmarking the copyright checker.
+
+The layout follows the paths referenced by check_copyright_config.yaml: components with
+optional LICENSE files, `examples/basic_examples/` and `test_apps/` using the Apache-2.0
+job, and `managed_components/` and `build/` trees that are ignored.
+"""
+import os
+import sys
+import random
+import argparse
+
+import yaml
+
+from datetime import datetime
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(REPO_ROOT, 'check_copyright_config.yaml')
+BENCH_CONFIG_NAME = 'check_copyright_config.yaml'
+
+sys.path.insert(0, REPO_ROOT)
+from check_copyright import format_license_file  # noqa: E402
+
+
+SOURCE_EXTENSIONS = ['.c', '.h', '.cpp', '.hpp']
+BODY_LINE = 'static int value_{index} = {index};\n'
+
+
+def render(template, license_name, year):
+    return template.format(license=license_name, year=year).strip()
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def generate_repo(root, file_count = 2000, depth = 4, license_ratio = 0.5, header_lines = 0, body_lines = 50,
+                  ignore_patterns = 50, fail_ratio = 0.1, seed = 0, config_path = DEFAULT_CONFIG):
+    """
+    Generate a synthetic repository.
+
+    Args:
+        root (str): Directory to create the repository in.
+        file_count (int): Number of source files.
+        depth (int): Maximum directory depth below a component.
+        license_ratio (float): Fraction of components that carry their own LICENSE file.
+        header_lines (int): Extra comment lines after the copyright declaration.
+        body_lines (int): Code lines after the header.
+        ignore_patterns (int): Extra `ignore` globs added to the configuration.
+        fail_ratio (float): Fraction of files with a missing or outdated copyright declaration.
+        seed (int): Random seed, the same arguments always produce the same repository.
+        config_path (str): Configuration used as the base of the generated one.
+
+    Returns:
+        dict: Generation summary (paths and counts).
+    """
+    rng = random.Random(seed)
+    year = datetime.now().year
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+
+    # More ignore globs make rule matching more expensive, as in large monorepos
+    config['ignore']['include'] = list(config['ignore']['include']) + [f'**/vendor_{index}/**' for index in range(ignore_patterns)]
+    os.makedirs(os.path.join(root, '.git'), exist_ok=True)
+    with open(os.path.join(root, BENCH_CONFIG_NAME), 'w', encoding='utf-8') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+
+    default_job = config['DEFAULT']
+    apache_job = dict(default_job, **config['examples_and_test_apps'])
+    default_license = default_job['license_for_new_files']
+    license_text = render(format_license_file(default_job['espressif_copyright_full']), default_license, year)
+    headers = {
+        'full': render(default_job['espressif_copyright_full'], default_license, year),
+        'short': render(default_job['espressif_copyright_short'], default_license, year),
+        'apache': render(apache_job['espressif_copyright_full'], apache_job['license_for_new_files'], year),
+    }
+
+    component_count = max(1, file_count // 40)
+    licensed_components = set(rng.sample(range(component_count), int(component_count * license_ratio)))
+    for component in licensed_components:
+        write_file(os.path.join(root, 'components', f'comp_{component}', 'LICENSE'), license_text + '\n')
+
+    extra_header = ''.join(f' * Additional notice line {index}\n' for index in range(header_lines))
+    failing = 0
+    for index in range(file_count):
+        component = rng.randrange(component_count)
+        extension = rng.choice(SOURCE_EXTENSIONS)
+        sub_dirs = [f'dir_{rng.randrange(4)}' for _ in range(rng.randint(0, depth))]
+        kind = rng.random()
+        if kind < 0.1:
+            directory = os.path.join(root, 'examples', 'basic_examples', f'example_{component}', 'main', *sub_dirs)
+            header = headers['apache']
+        elif kind < 0.2:
+            directory = os.path.join(root, 'components', f'comp_{component}', 'test_apps', 'main', *sub_dirs)
+            header = headers['apache']
+        elif kind < 0.25:
+            directory = os.path.join(root, 'managed_components', f'managed_{component}', *sub_dirs)
+            header = ''
+        elif kind < 0.3:
+            directory = os.path.join(root, 'build', f'comp_{component}', *sub_dirs)
+            header = ''
+        else:
+            directory = os.path.join(root, 'components', f'comp_{component}', *sub_dirs)
+            header = headers['short'] if component in licensed_components else headers['full']
+
+        if header and rng.random() < fail_ratio:
+            failing += 1
+            header = '' if rng.random() < 0.5 else header.replace(str(year), str(year - 3))
+        if header and extra_header:
+            header = header[:-len('*/')] + extra_header + ' */'
+
+        body = ''.join(BODY_LINE.format(index=line) for line in range(body_lines))
+        write_file(os.path.join(directory, f'file_{index}{extension}'), f'{header}\n{body}' if header else body)
+
+    return {
+        'root': root,
+        'config': os.path.join(root, BENCH_CONFIG_NAME),
+        'files': file_count,
+        'failing': failing,
+        'components': component_count,
+        'licensed_components': len(licensed_components),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic repository for benchmarking check-copyright.")
+    parser.add_argument('root', help = 'Directory to create the repository in')
+    parser.add_argument('--files', default = 2000, type = int, help = 'Number of source files')
+    parser.add_argument('--depth', default = 4, type = int, help = 'Maximum directory depth below a component')
+    parser.add_argument('--license-ratio', default = 0.5, type = float, help = 'Fraction of components with a LICENSE file')
+    parser.add_argument('--header-lines', default = 0, type = int, help = 'Extra comment lines in each header')
+    parser.add_argument('--body-lines', default = 50, type = int, help = 'Code lines in each file')
+    parser.add_argument('--ignore-patterns', default = 50, type = int, help = 'Extra ignore globs in the configuration')
+    parser.add_argument('--fail-ratio', default = 0.1, type = float, help = 'Fraction of non-compliant files')
+    parser.add_argument('--seed', default = 0, type = int, help = 'Random seed')
+    args = parser.parse_args()
+
+    summary = generate_repo(
+        args.root, file_count=args.files, depth=args.depth, license_ratio=args.license_ratio,
+        header_lines=args.header_lines, body_lines=args.body_lines, ignore_patterns=args.ignore_patterns,
+        fail_ratio=args.fail_ratio, seed=args.seed
+    )
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
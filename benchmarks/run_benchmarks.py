@@ -0,0 +1,313 @@
+"""
+Benchmark suite for the copyright checker.
+
+Generates a synthetic repository, times `LicenseChecker.process`, `get_config`,
+`check_license_file` and `replace_copyright` separately, and compares the throughput
+(files/sec) with a stored baseline so that regressions fail loudly.
+
+Start-up is measured by running the command line on a single file, cold (no cache
+directory) and warm (configuration snapshot present), and the imports of a warm run
+are profiled with `python -X importtime`.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # compare with baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline  # record a new baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from check_copyright import LicenseChecker  # noqa: E402
+from generate_repo import generate_repo  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+CHECKER_PATH = os.path.join(os.path.dirname(BENCH_DIR), 'check_copyright.py')
+STARTUP_RUNS = 10  # Command line runs per start-up phase, the best time is kept
+STARTUP_TOP_IMPORTS = 8  # Number of slowest imports printed
+WARM_FORBIDDEN_IMPORTS = ('yaml', 'subprocess', 'multiprocessing', 'check_copyright_index', 'check_copyright_report',
+                          'check_copyright_server', 'check_copyright_shard',
+                          'check_copyright_watch')  # Must not be imported by a warm run on one file
+DEFAULT_TOLERANCE = 0.5  # Fail when a phase is more than 50% slower than the baseline
+SCENARIO = {
+    'file_count': 3000,
+    'depth': 4,
+    'license_ratio': 0.5,
+    'header_lines': 0,
+    'body_lines': 200,
+    'ignore_patterns': 50,
+    'fail_ratio': 0.1,
+    'seed': 0,
+}
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of the process in MiB, None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(function, repeat):
+    """
+    Run a function several times and return the best wall time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def new_checker(config_path, jobs = 1):
+    return LicenseChecker(config_path=config_path, file=['.'], jobs=jobs)
+
+
+def bench_process(config_path, jobs):
+    checker = new_checker(config_path, jobs)
+    checker.process()
+    return checker
+
+
+def bench_get_config(config_path, file_paths):
+    checker = new_checker(config_path)
+    for file_path in file_paths:
+        checker.get_config(checker.config, file_path)
+
+
+def bench_check_license_file(config_path, file_paths):
+    checker = new_checker(config_path)
+    for file_path in file_paths:
+        checker.job_config = checker.get_config(checker.config, file_path)
+        if checker.job_config is not None:
+            checker.compiled_job = checker.get_compiled_job(checker.job_config)
+            checker.check_license_file(file_path)
+
+
+def bench_replace_copyright(repo_root, config_path, work_dir):
+    """
+    Fix every non-compliant file of a fresh copy of the repository.
+
+    Returns:
+        tuple[float, int]: Wall time of the replacement and number of files replaced.
+    """
+    copy_root = os.path.join(work_dir, 'replace')
+    shutil.rmtree(copy_root, ignore_errors=True)
+    shutil.copytree(repo_root, copy_root)
+    os.chdir(copy_root)
+    checker = LicenseChecker(config_path=config_path, file=['.'], replace=True)
+    for file_path in checker.collect_files():
+        checker.check_copyright(file_path)
+    invalid_files = sorted(checker.invalid_copyright_full_set | checker.invalid_copyright_short_set)
+
+    start = time.perf_counter()
+    checker.replace_files(invalid_files)
+    elapsed = time.perf_counter() - start
+    os.chdir(repo_root)
+    return elapsed, len(invalid_files)
+
+
+def run_cli(config_path, file_path, import_time = False):
+    """
+    Run the command line checker on one file in a new interpreter.
+
+    Returns:
+        subprocess.CompletedProcess: The finished run, with its stderr captured.
+    """
+    command = [sys.executable]
+    if import_time:
+        command += ['-X', 'importtime']
+    command += [CHECKER_PATH, '--no-daemon', '--config', config_path, file_path]
+    return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def bench_startup(config_path, file_path, cold):
+    """
+    Time the command line on one file, keeping the best of STARTUP_RUNS runs.
+
+    Args:
+        cold (bool): Remove the cache directory (configuration snapshot and results) before every run.
+
+    Returns:
+        float: Best wall time in seconds.
+    """
+    cache_dir = os.path.join('.git', 'check-copyright-cache')
+    run_cli(config_path, file_path)
+    best = None
+    for _ in range(STARTUP_RUNS):
+        if cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        start = time.perf_counter()
+        run_cli(config_path, file_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def profile_imports(config_path, file_path):
+    """
+    Profile the imports of a warm command line run with `python -X importtime`.
+
+    Returns:
+        dict: Cumulative import time in milliseconds per top-level module.
+    """
+    run_cli(config_path, file_path)
+    imports = {}
+    for line in run_cli(config_path, file_path, import_time=True).stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented and already counted by their parent
+        if not cumulative.strip().isdigit() or name.startswith('  '):
+            continue
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def run_benchmarks(scenario, repeat, jobs):
+    """
+    Run all benchmark phases on a freshly generated repository.
+
+    Returns:
+        dict: Results per phase (seconds, files and files/sec) and peak RSS.
+    """
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix='check-copyright-bench-')
+    previous_dir = os.getcwd()
+    try:
+        repo_root = os.path.join(work_dir, 'repo')
+        summary = generate_repo(repo_root, **scenario)
+        config_path = summary['config']
+        os.chdir(repo_root)
+
+        file_paths = list(new_checker(config_path).collect_files())
+        file_count = len(file_paths)
+
+        phases = {
+            'process': lambda: bench_process(config_path, 1),
+            'get_config': lambda: bench_get_config(config_path, file_paths),
+            'check_license_file': lambda: bench_check_license_file(config_path, file_paths),
+        }
+        if jobs > 1:
+            phases[f'process_jobs_{jobs}'] = lambda: bench_process(config_path, jobs)
+
+        for name, function in phases.items():
+            elapsed = timed(function, repeat)
+            results[name] = {'seconds': elapsed, 'files': file_count, 'files_per_sec': file_count / elapsed}
+
+        # Every run needs a fresh copy of the repository, keep the best one
+        elapsed, replaced = min(bench_replace_copyright(repo_root, config_path, work_dir) for _ in range(repeat))
+        results['replace_copyright'] = {'seconds': elapsed, 'files': replaced, 'files_per_sec': replaced / elapsed if elapsed else 0.0}
+
+        # An old configuration file, so that the snapshot does not need to be verified by hashing
+        old_time = time.time() - 60
+        os.utime(config_path, (old_time, old_time))
+        for name, cold in (('startup_cold', True), ('startup_warm', False)):
+            elapsed = bench_startup(config_path, file_paths[0], cold)
+            results[name] = {'seconds': elapsed, 'files': 1, 'files_per_sec': 1 / elapsed}
+        imports = profile_imports(config_path, file_paths[0])
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'scenario': scenario, 'phases': results, 'imports_ms': imports, 'peak_rss_mb': peak_rss_mb()}
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Compare the throughput of every phase with the baseline.
+
+    Returns:
+        list[str]: Descriptions of the phases that regressed.
+    """
+    regressions = []
+    if baseline.get('scenario') != report['scenario']:
+        print("warning: the baseline was recorded with a different scenario, comparison is approximate")
+    for name, result in report['phases'].items():
+        expected = baseline.get('phases', {}).get(name)
+        if expected is None or not expected['files_per_sec']:
+            continue
+        ratio = result['files_per_sec'] / expected['files_per_sec']
+        if ratio < 1 - tolerance:
+            regressions.append(f"{name}: {result['files_per_sec']:.0f} files/sec vs baseline {expected['files_per_sec']:.0f} ({ratio:.0%})")
+    for module in WARM_FORBIDDEN_IMPORTS:
+        if module in report['imports_ms']:
+            regressions.append(f"startup_warm: imports {module} ({report['imports_ms'][module]:.1f} ms)")
+    return regressions
+
+
+def print_report(report, baseline):
+    print(f"{'phase':<24}{'files':>8}{'seconds':>10}{'files/sec':>12}{'baseline':>12}")
+    for name, result in report['phases'].items():
+        expected = baseline.get('phases', {}).get(name, {}).get('files_per_sec') if baseline else None
+        expected_text = f"{expected:.0f}" if expected else '-'
+        print(f"{name:<24}{result['files']:>8}{result['seconds']:>10.3f}{result['files_per_sec']:>12.0f}{expected_text:>12}")
+    if report['peak_rss_mb'] is not None:
+        print(f"peak RSS: {report['peak_rss_mb']:.1f} MiB")
+    imports = sorted(report['imports_ms'].items(), key=lambda item: item[1], reverse=True)
+    print(f"warm start imports: {sum(report['imports_ms'].values()):.1f} ms, slowest: " + ', '.join(f"{name} {milliseconds:.1f}" for name, milliseconds in imports[:STARTUP_TOP_IMPORTS]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark check-copyright on a synthetic repository.")
+    parser.add_argument('--files', default = SCENARIO['file_count'], type = int, help = 'Number of source files')
+    parser.add_argument('--repeat', default = 3, type = int, help = 'Runs per phase, the best time is kept')
+    parser.add_argument('--jobs', default = os.cpu_count() or 1, type = int, help = 'Worker processes for the parallel phase')
+    parser.add_argument('--tolerance', default = DEFAULT_TOLERANCE, type = float, help = 'Allowed slowdown before failing (0.5 = 50%%)')
+    parser.add_argument('--baseline', default = BASELINE_PATH, help = 'Baseline JSON file')
+    parser.add_argument('--update-baseline', action = 'store_true', help = 'Write the results as the new baseline')
+    parser.add_argument('--output', help = 'Also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.CRITICAL)
+    scenario = dict(SCENARIO, file_count=args.files)
+    report = run_benchmarks(scenario, args.repeat, args.jobs)
+
+    baseline = {}
+    if os.path.isfile(args.baseline) and not args.update_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare_with_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print("Performance regressions:")
+        for regression in regressions:
+            print(f" - {regression}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
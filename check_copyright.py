@@ -1,14 +1,30 @@
 import os
-import re
 import sys
-import subprocess
+
+if __name__ == "__main__":
+    # A running daemon takes the check before the rest of the script is even imported
+    from check_copyright_client import exit_if_served
+    exit_if_served(sys.argv[1:])
+
+import re
+import codecs
 import logging
 import argparse
-import yaml
+import itertools
+import json
+import marshal
+import collections
+import heapq
+import stat
+import threading
+import time
 import fnmatch
 
 from datetime import datetime
 
+# Modules needed only by some modes (PyYAML, subprocess, multiprocessing, socket, ...) are
+# imported in the functions using them, to keep the startup of a plain check fast
+
 
 INCLUDE_PATH = 'include'  # The range of file paths that should be checked
 LICENSE_FILE_NAME = 'LICENSE'  # Default license file name
@@ -17,6 +33,66 @@ ESPRESSIF_COPYRIGHT_FULL = 'espressif_copyright_full'  # Complete Copyright Stat
 ESPRESSIF_COPYRIGHT_SHORT = 'espressif_copyright_short'  # Simple Copyright Statement Template
 LICENSE_FOR_NEW_FILES = 'license_for_new_files'  # Specifies the license name that new files should use
 
+COMMENT_STYLES_KEY = 'comment_styles'  # Extension -> comment style name, in DEFAULT, extends EXTENSION_COMMENT_STYLES
+HEADER_WINDOW_BYTES = 'header_window_bytes'  # Number of bytes at the top of a file searched for the copyright declaration
+HEADER_WINDOW_LINES = 'header_window_lines'  # Optional limit on the number of lines in the header window
+DEFAULT_HEADER_WINDOW_BYTES = 8192
+FILE_READ_SIZE = 65536  # Bytes read at a time when a whole file is needed
+
+EXTENSION_COMMENT_STYLES = {  # Checked file extensions (lowercase) -> name of their comment style in COMMENT_STYLES
+    '.c': 'c', '.cpp': 'c', '.h': 'c', '.cc': 'c', '.hpp': 'c', '.hxx': 'c', '.hh': 'c',
+    '.ld': 'c', '.s': 'c',
+    '.py': 'hash',
+    '.asm': 'asm', '.bsasm': 'asm',
+}
+
+STATS_SLOWEST_FILES = 10  # Number of slowest files listed by --stats
+STATS_PHASES = ('config_load', 'git_history', 'file_discovery', 'rule_matching', 'license_lookup', 'file_reads', 'regex_checks', 'rewrites')
+
+REWRITE_THREADS = 8  # Threads writing fixed files with --replace
+
+PARALLEL_MIN_FILES = 256  # Smaller file sets are checked in the main process
+PARALLEL_CHUNK_SIZE = 64  # Number of files sent to a worker process at a time
+
+RESULT_CACHE_DIR = 'check-copyright-cache'  # Cache directory inside `.git`
+RESULT_CACHE_SHARD_DIR = 'results'  # Shard files of the cached verdicts of files that passed the check, inside the cache directory
+RESULT_CACHE_SHARDS = 256  # Number of shard files, a run only reads the shards of the files it checks
+RESULT_CACHE_MAX_ENTRIES = 51200  # Least recently used entries beyond this (an even share per shard) are evicted
+RESULT_CACHE_RACY_NS = 2 * 10**9  # Files modified this recently when checked are not cached
+RESULT_CACHE_VERSION = 2  # Bump when the checking rules change in a way that invalidates cached verdicts
+
+GIT_YEARS_FILE = 'git-years.json'  # First and last commit year of every file, inside the cache directory
+GIT_YEARS_VERSION = 1  # Bump when the year index layout changes
+GIT_LOG_READ_SIZE = 65536  # Bytes of `git log` output parsed at a time
+LICENSE_INDEX_FILE = 'license-index.json'  # Directories of the HEAD tree with their LICENSE and the jobs of their files, inside the cache directory
+LICENSE_INDEX_VERSION = 1  # Bump when the license index layout changes
+PATH_STREAM_READ_SIZE = 65536  # Most bytes of a path list (stdin, `git ls-files`) read at a time
+YEAR_RANGE_PATTERN = r'\d{4}(?:-\d{4})?'  # Copyright years accepted with --git-years: YYYY or YYYY-YYYY
+
+CONFIG_SNAPSHOT_FILE = 'config-snapshot.marshal'  # Parsed configuration files, inside the cache directory
+CONFIG_SNAPSHOT_VERSION = 1  # Bump when the snapshot layout changes
+CONFIG_SNAPSHOT_RACY_NS = 2 * 10**9  # Configuration files modified this close to their snapshot are hashed again
+
+WATCH_DEBOUNCE_SECONDS = 0.2  # With --watch, a burst of changes ends after this long without events
+WATCH_MAX_DELAY_SECONDS = 2.0  # With --watch, changes are checked at the latest this long after the first one
+
+SCAN_ALLOWED = 'allowed_license'  # One of the allowed license notices
+SCAN_NEW_LICENSE = 'license_for_new_files'  # The license new files should use
+SPDX_IDENTIFIER_REGEX = re.compile(r'SPDX-License-Identifier:[ \t]*([^\s*]+(?:[ \t]+[^\s*]+)*)')
+COPYRIGHT_YEAR_REGEX = re.compile(r'(?:Copyright \([cC]\)|SPDX-FileCopyrightText:)[ \t]*(\d{4}(?:[ \t]*-[ \t]*\d{4})?)')
+CODING_LINE_PATTERN = r'[ \t\f]*#[^\r\n]*?coding[:=][ \t]*[-\w.]+'  # PEP 263 encoding declaration of a Python file
+
+FILE_PASSED = 'pass'  # The file has a correct declaration
+FILE_FAILED = 'fail'  # The declaration of the file is missing or incorrect
+FILE_ERROR = 'error'  # The file could not be checked
+FILE_IGNORED = 'ignored'  # No job applies to the file
+
+REPORT_FORMATS = ('text', 'jsonl', 'sarif')  # Values of --format; text is the log output only
+
+LICENSE_VALID = 'valid'  # LICENSE file matches the expected license and template
+LICENSE_INVALID_FORMAT = 'invalid_format'  # LICENSE file has the expected license but not the template
+LICENSE_MISMATCH = 'mismatch'  # LICENSE file declares a different license
+
 
 LOG_LEVELS = {
     0: logging.WARNING,
@@ -41,446 +117,2741 @@ def print_error(message):
     logging.error(f"\033[31m{message}\033[0m")
 
 
-class LicenseChecker:
+class RuleMatcher:
     """
-    Used to check whether the LICENSE and copyright declaration of newly added files
-    comply with company specifications, and automatically fix non-compliant content
-    based on configuration.
+    Compiled form of the include globs of every job, built once from the configuration.
+
+    All globs of a job are combined into a single regular expression, and the merged
+    configuration is memoized per combination of matching jobs, so resolving a file
+    costs one regex match per job plus a dictionary lookup.
     """
-    def __init__(self, config_path = 'check_copyright_config.yaml', file = [], replace = False):
+    def __init__(self, config):
         """
-        Initialize the checker instance.
+        Compile the include globs of all jobs.
 
         Args:
-            config_path (str): Path to the YAML configuration file.
-            file (List[str]): List of file paths to check.
-            replace (bool): Whether to enable automatic fixing.
+            config (dict): All configuration data.
         """
-        self.config = self.load_config(config_path)
-        self.job_config = ''
-        self.new_file = file
-        self.replace = replace
-        self.current_year = datetime.now().year
-        self.valid_extensions = {'.c', '.cpp', '.h', '.cc', '.hpp', '.hxx', '.hh'}
-        self.check_result = True
-        self.invalid_license_file_set = set()
-        self.invalid_copyright_full_set = set()
-        self.invalid_copyright_short_set = set()
+        self.default_config = config.get('DEFAULT', {})
+        self.rules = []  # (rule_name, compiled include regex) in configuration order
+        self.rule_data = {}
+        for rule_name, rule_data in config.items():
+            if rule_name == 'DEFAULT':
+                continue
+            include_path = rule_data.get(INCLUDE_PATH, [])
+            if not include_path:
+                continue
+            pattern = '|'.join(fnmatch.translate(os.path.normcase(path_index)) for path_index in include_path)
+            self.rules.append((rule_name, re.compile(pattern)))
+            self.rule_data[rule_name] = rule_data
+        self.merged_configs = {(): self.default_config}
+        self.job_names = {id(self.default_config): 'DEFAULT'}  # id(merged configuration) -> job name, for reports
+
+        # A glob ending with `*` matches everything below a directory whose path followed by
+        # a separator matches it, so such directories can be pruned from the walk
+        ignore_path = self.rule_data.get('ignore', {}).get(INCLUDE_PATH, [])
+        ignore_dir_path = [path_index for path_index in ignore_path if path_index.endswith('*')]
+        if ignore_dir_path:
+            pattern = '|'.join(fnmatch.translate(os.path.normcase(path_index)) for path_index in ignore_dir_path)
+            self.ignore_dir_regex = re.compile(pattern)
+        else:
+            self.ignore_dir_regex = None
 
 
-    def load_config(self, config_path='check_copyright_config.yaml'):
+    def match_rules(self, target_file_path):
         """
-        Load configuration from a YAML file.
+        Get the names of the jobs whose include globs match a file path.
 
         Args:
-            config_path (str): Path to the configuration file.
+            target_file_path (str): File path to match.
 
         Returns:
-            dict: Configuration contents (rules for each job name).
-        """
-        with open(config_path, 'r', encoding='utf-8') as file:
-            config = yaml.safe_load(file)
-        return config
-
-
-    def print_copyright(self):
+            tuple[str] or None: Matching job names in configuration order, None if the file is ignored.
         """
-        Print standard LICENSE and copyright templates for reference.
+        target_file_path = os.path.normcase(target_file_path)
+        matched_rules = []
+        for rule_name, rule_regex in self.rules:
+            if rule_regex.match(target_file_path):
+                # Check if it is in the list of ignored files
+                if rule_name == 'ignore':
+                    return None
+                matched_rules.append(rule_name)
+        return tuple(matched_rules)
+
+
+    def is_ignored_dir(self, directory):
         """
-        for job_name, job_config in self.config.items():
-            # self.process_job(job_name, job_config)
-            if job_name != 'ignore':
-                espressif_copyright_full = job_config.get(ESPRESSIF_COPYRIGHT_FULL, 'Default Full').format(license=job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
-                espressif_copyright_short = job_config.get(ESPRESSIF_COPYRIGHT_SHORT, 'Default Short').format(license=job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
-                include = job_config.get(INCLUDE_PATH, '')
-                print_info(f"Processing job: {job_name}")
-                print_warning(f"The content of the LICENSE file under this path should be as follows: {include}")
-                print_warning(f"Espressif LICENSE file:")
-                print_info(f"{self.format_license_file(espressif_copyright_full).strip()}\n")
-                print_warning(f"Espressif Copyright Full:")
-                print_info(f"{espressif_copyright_full}")
-                print_warning(f"Espressif Copyright Short:")
-                print_info(f"{espressif_copyright_short}")
-                print_warning('-' * 50)
-
-
-    def get_invalid_license_file_set(self):
-        return self.invalid_license_file_set
-
-
-    def get_invalid_copyright_full_set(self):
-        return self.invalid_copyright_full_set
+        Check whether every file below a directory is ignored.
 
+        Args:
+            directory (str): Directory path.
 
-    def get_invalid_copyright_short_set(self):
-        return self.invalid_copyright_short_set
+        Returns:
+            bool: Whether the directory can be skipped.
+        """
+        if self.ignore_dir_regex is None:
+            return False
+        return self.ignore_dir_regex.match(os.path.normcase(directory) + os.sep) is not None
 
 
-    def get_commit_file(self):
+    def match(self, target_file_path):
         """
-        Get newly added files from the current commit (via `git diff`).
+        Get the merged rule configuration that applies to a file path.
+
+        Args:
+            target_file_path (str): File path to match.
 
         Returns:
-            list[str]: List of added file paths.
+            dict or None: Matched rule configuration, None if the file is ignored.
         """
-        try:
-            result = subprocess.run(
-                ['git', 'diff', '--name-status', 'HEAD~1', 'HEAD'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=True
-            )
-            new_files = [
-                line.split('\t')[1]
-                for line in result.stdout.splitlines()
-                if line.startswith('A')
-            ]
-            return new_files
-        except subprocess.CalledProcessError as e:
-            print_error(f"Error occurred while retrieving newly added files: {e}")
-            sys.exit(1)
+        return self.get_merged_config(self.match_rules(target_file_path))
 
 
-    def get_file_in_directory(self, directory):
+    def get_merged_config(self, rule_key):
         """
-        Get all source code files with valid extensions under the directory.
+        Get the merged configuration of a combination of jobs, merging it on first use.
 
         Args:
-            directory (str): Path to the directory.
+            rule_key (tuple[str] or None): Matching job names returned by `match_rules`.
 
         Returns:
-            list[str]: List of file paths.
+            dict or None: Merged rule configuration, None if the file is ignored.
         """
-        file_paths = []
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                # Get the extension and convert it to lowercase
-                file_extension = os.path.splitext(file)[1].lower()
-                if file_extension in self.valid_extensions:
-                    file_paths.append(os.path.join(root, file))
-        return file_paths
+        if rule_key is None:
+            return None
+
+        merged_config = self.merged_configs.get(rule_key)
+        if merged_config is None:
+            merged_config = self.default_config
+            for rule_name in rule_key:
+                merged_config = merge_configs(merged_config, self.rule_data[rule_name])
+            self.merged_configs[rule_key] = merged_config
+            self.job_names[id(merged_config)] = '+'.join(rule_key)
+        return merged_config
 
 
-    def get_config(self, config, target_file_path):
+    def get_job_name(self, job_config):
         """
-        Get the rule configuration that matches a specific file path.
+        Get the name of a merged configuration returned by `match`: the matching jobs joined with `+`.
+        """
+        return self.job_names.get(id(job_config))
 
-        Args:
-            config (dict): All configuration data.
-            target_file_path (str): File path to match.
 
-        Returns:
-            dict or None: Matched rule configuration.
+def merge_configs(default_config, special_config):
+    """
+    Merge the DEFAULT and specific job configuration, prioritizing job settings.
+
+    Returns:
+        dict: Merged configuration.
+    """
+    merged_config = {}
+
+    for key, value in default_config.items():
+        merged_config[key] = value
+
+    for key, value in special_config.items():
+        # The value in the rule configuration will override the value in the default configuration
+        merged_config[key] = value
+
+    return merged_config
+
+
+class LicenseCache:
+    """
+    Per-run cache of LICENSE lookups shared by all checked files.
+
+    Every directory is probed on the filesystem at most once, every LICENSE file is
+    read at most once, and the result of each upward walk is reused by sibling and
+    child directories. With a license index, directories of the HEAD tree are answered
+    from the index instead of the filesystem.
+    """
+    def __init__(self):
+        self.index = None  # LicenseIndex of the repository, None to probe every directory
+        self.license_files = {}  # directory -> LICENSE path or None
+        self.git_roots = {}  # directory -> whether it contains `.git`
+        self.license_contents = {}  # LICENSE path -> file content
+        self.verdicts = {}  # (LICENSE path, expected license, expected text) -> verdict
+        self.resolved = {}  # (job key, directory, exit flag) -> (LICENSE path, verdict)
+        self.hits = 0
+        self.probes = 0
+        self.reads = 0
+
+
+    def find_license_file(self, directory):
         """
-        # First check the DEFAULT section, returning to the global configuration
-        default_config = config.get('DEFAULT', {})
+        Get the LICENSE file directly inside a directory.
 
-        # Traverse other rule parts
-        for rule_name, rule_data in config.items():
-            if rule_name == 'DEFAULT':
-                continue
+        Returns:
+            str or None: LICENSE file path, None if the directory has no LICENSE file.
+        """
+        if directory not in self.license_files:
+            license_path = os.path.join(directory, LICENSE_FILE_NAME)
+            has_license = self.index.has_license_file(directory) if self.index is not None else None
+            if has_license is None:
+                self.probes += 1
+                has_license = os.path.isfile(license_path)
+            self.license_files[directory] = license_path if has_license else None
+        return self.license_files[directory]
 
-            include_path = rule_data.get(INCLUDE_PATH, [])
-            # If target_file_path matches any include path, return the configuration of that rule
-            for path_index in include_path:
-                if fnmatch.fnmatch(target_file_path, path_index):
-                    # Check if it is in the list of ignored files
-                    if rule_name == 'ignore':
-                        return None
-                    else:
-                        default_config = self.merge_configs(default_config, rule_data)
 
-        return default_config
+    def is_git_root(self, directory):
+        """
+        Check whether a directory is the root of a Git repository.
+        """
+        if directory not in self.git_roots:
+            # Indexed directories other than the top level are not a repository of their own
+            if self.index is not None and self.index.get_dir_key(directory) and self.index.get_dir_entry(directory) is not None:
+                self.git_roots[directory] = False
+            else:
+                self.probes += 1
+                self.git_roots[directory] = os.path.isdir(os.path.join(directory, '.git'))
+        return self.git_roots[directory]
 
 
-    def generate_license_text(self, license_name, copyright_template):
+    def read_license_file(self, license_path):
         """
-        Generate the formatted license text.
+        Get the content of a LICENSE file, reading it from disk only once.
         """
-        formatted_copyright = copyright_template.format(license=license_name, year=self.current_year)
-        indented_copyright = '\n'.join(f'{line}' for line in formatted_copyright.splitlines())
-        license_text = f"""{indented_copyright}"""
-        return license_text
+        if license_path not in self.license_contents:
+            self.reads += 1
+            with open(license_path, 'r', encoding='utf-8') as f:
+                self.license_contents[license_path] = f.read()
+        return self.license_contents[license_path]
 
 
-    def merge_configs(self, default_config, special_config):
+    def get_stats(self):
         """
-        Merge the DEFAULT and specific job configuration, prioritizing job settings.
+        Get the cache counters.
 
         Returns:
-            dict: Merged configuration.
+            dict: Number of cache hits, filesystem probes and LICENSE file reads.
         """
-        merged_config = {}
+        return {'hits': self.hits, 'probes': self.probes + (self.index.probes if self.index is not None else 0), 'reads': self.reads}
 
-        for key, value in default_config.items():
-            merged_config[key] = value
 
-        for key, value in special_config.items():
-            # The value in the rule configuration will override the value in the default configuration
-            merged_config[key] = value
+    def merge_stats(self, stats):
+        """
+        Add the counters of another cache (e.g. of a worker process) to this one.
+        """
+        self.hits += stats['hits']
+        self.probes += stats['probes']
+        self.reads += stats['reads']
 
-        return merged_config
 
+class RunStats:
+    """
+    Wall time and call counts per phase, I/O counters and the slowest files of a run.
 
-    def format_license_file(self, input_string):
-        """
-        Format the LICENSE template (remove the first three characters of each line).
+    Only created when statistics are requested; the checker skips all bookkeeping when
+    its `stats` attribute is None.
+    """
+    def __init__(self, slowest_files = STATS_SLOWEST_FILES):
+        self.phases = {phase: [0.0, 0] for phase in STATS_PHASES}  # phase -> [seconds, calls]
+        self.counters = {'files_checked': 0, 'bytes_read': 0, 'stat_calls': 0}
+        self.slowest_files_count = slowest_files
+        self.slowest_files = []  # Min-heap of (seconds, file path)
 
-        Args:
-            input_string (str): Original template string.
 
-        Returns:
-            str: Processed LICENSE content.
-        """
-        lines = input_string.splitlines()
+    def add_phase(self, phase, seconds):
+        entry = self.phases[phase]
+        entry[0] += seconds
+        entry[1] += 1
 
-        # Remove the first three characters from each line
-        modified_lines = [line[3:] if len(line) > 3 else '' for line in lines]
 
-        # Rejoin the processed lines into a new string
-        return '\n'.join(modified_lines)
+    def count(self, counter, value = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
 
 
-    def check_license_file(self, file_path):
+    def add_file(self, file_path, seconds):
         """
-        Check whether a LICENSE file exists and whether the content matches the template.
+        Record the total checking time of a file.
+        """
+        self.counters['files_checked'] += 1
+        if len(self.slowest_files) < self.slowest_files_count:
+            heapq.heappush(self.slowest_files, (seconds, file_path))
+        elif seconds > self.slowest_files[0][0]:
+            heapq.heapreplace(self.slowest_files, (seconds, file_path))
 
-        Args:
-            file_path (str): Path to a source file (used to search upward for LICENSE).
 
-        Returns:
-            bool: Whether it matches the requirements.
+    def to_dict(self):
+        return {
+            'phases': {phase: {'seconds': seconds, 'calls': calls} for phase, (seconds, calls) in self.phases.items()},
+            'counters': dict(self.counters),
+            'slowest_files': [{'path': file_path, 'seconds': seconds} for seconds, file_path in sorted(self.slowest_files, reverse=True)],
+        }
+
+
+    def merge(self, stats):
         """
-        exit_flag = False  # Marks whether to match any include path
-        current_dir = os.path.dirname(file_path)
-        expect_license = self.job_config.get(LICENSE_FOR_NEW_FILES, '')
-        include_path = self.job_config.get(INCLUDE_PATH, [])
+        Add the statistics of another run (e.g. a chunk checked by a worker process), given as `to_dict()` output.
+        """
+        for phase, entry in stats['phases'].items():
+            self.phases[phase][0] += entry['seconds']
+            self.phases[phase][1] += entry['calls']
+        for counter, value in stats['counters'].items():
+            self.count(counter, value)
+        for slow_file in stats['slowest_files']:
+            if len(self.slowest_files) < self.slowest_files_count:
+                heapq.heappush(self.slowest_files, (slow_file['seconds'], slow_file['path']))
+            elif slow_file['seconds'] > self.slowest_files[0][0]:
+                heapq.heapreplace(self.slowest_files, (slow_file['seconds'], slow_file['path']))
+
+
+    def print_summary(self):
+        """
+        Print the statistics as a table.
+        """
+        print_info(f"{'phase':<18}{'calls':>10}{'seconds':>12}")
+        for phase, (seconds, calls) in self.phases.items():
+            print_info(f"{phase:<18}{calls:>10}{seconds:>12.4f}")
+        for counter, value in self.counters.items():
+            print_info(f"{counter:<18}{value:>10}")
+        if self.slowest_files:
+            print_info("Slowest files:")
+            for seconds, file_path in sorted(self.slowest_files, reverse=True):
+                print_info(f"{seconds:>10.4f}s  {file_path}")
+
+
+def format_license_file(input_string):
+    """
+    Format the LICENSE template (remove the first three characters of each line).
 
-        while current_dir != os.path.dirname(current_dir):  # 循环直到到达根目录
-            license_path = os.path.join(current_dir, LICENSE_FILE_NAME)
-
-            if os.path.isfile(license_path):
-                if license_path not in self.invalid_license_file_set:
-                    print_debug(f"Found LICENSE file at: {license_path}")
-                    with open(license_path, 'r', encoding='utf-8') as f:
-                        license_file = f.read()
-
-                    # Check that the LICENSE content contains the expected license notice
-                    if expect_license in license_file:
-                        print_debug(f"LICENSE file in {current_dir} matches expected license: {expect_license}")
-
-                        # Check if the copyright format is correct
-                        expect_copyright = self.format_license_file(
-                            self.job_config[ESPRESSIF_COPYRIGHT_FULL]
-                        ).strip()
-
-                        expect_copyright = expect_copyright.format(license=expect_license, year=self.current_year)
-                        if expect_copyright.strip() == license_file.strip():
-                            print_debug(f"LICENSE file format of {license_path} is correct.")
-                        else:
-                            print_debug(f"LICENSE file format of {license_path} is incorrect.")
-                            self.invalid_license_file_set.add(license_path)
-                            self.check_result = False
-                        return True
-                    else:
-                        print_warning(f"LICENSE in {current_dir} does not match expected license.")
-                        return False
+    Args:
+        input_string (str): Original template string.
 
-            if exit_flag:
-                break
+    Returns:
+        str: Processed LICENSE content.
+    """
+    lines = input_string.splitlines()
 
-            # Check if it is the root directory of the Git repository, and stop searching if it is
-            if os.path.isdir(os.path.join(current_dir, '.git')):
-                print_debug(f"Reached git repo at {current_dir}. Stopping search.")
-                break
+    # Remove the first three characters from each line
+    modified_lines = [line[3:] if len(line) > 3 else '' for line in lines]
 
-            # If not in the include list, exit
-            if not all(fnmatch.fnmatch(current_dir, path_index) for path_index in include_path):
-                exit_flag = True
+    # Rejoin the processed lines into a new string
+    return '\n'.join(modified_lines)
 
-            # Move up one directory
-            current_dir = os.path.dirname(current_dir)
 
-        print_debug("No LICENSE file found in any parent directory.")
-        return False
+class CompiledJob:
+    """
+    Templates and regular expressions of one effective job configuration.
+
+    Everything is formatted and compiled once when the job is first used, so checking
+    a file does no string formatting or regex compilation.
+    """
+    __slots__ = (
+        'job_config',
+        'year',
+        'expect_license',
+        'include_path',
+        'license_key',
+        'templates',
+        'declarations',
+        'copyright_regexes',
+        'license_file_text',
+        'allowed_licenses',
+        'header_regex',
+        'scan_patterns',
+        'byte_header_regex',
+        'byte_scan_patterns',
+    )
 
 
-    def replace_copyright(self, file_path):
+    def __init__(self, job_config, year):
         """
-        Automatically replace the copyright declaration
-        (including LICENSE files and comment blocks in source files).
+        Format the templates and compile the regular expressions of a job.
 
         Args:
-            file_path (str): Target file path.
+            job_config (dict): Merged job configuration.
+            year (int): Year written into the templates.
         """
-        copyright_type, copyright_pattern = self.get_copyright_pattern(file_path)
-        if copyright_pattern is not None:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-
-                if os.path.basename(file_path) == LICENSE_FILE_NAME:
-                    # Check if the copyright format is correct
-                    expect_license = self.job_config.get(LICENSE_FOR_NEW_FILES, '')
-                    expect_copyright = self.format_license_file(
-                        self.job_config[ESPRESSIF_COPYRIGHT_FULL]
-                    ).strip()
-                    expect_copyright = expect_copyright.format(license=expect_license, year=self.current_year)
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(expect_copyright + "\n")
-                    print_warning(f"Replaced incorrect license in: {file_path}")
-                else:
-                    # Matches a multi-line comment copyright notice
-                    re_multi_line_comment = re.compile(r'[\s\S]?/\*[\s\S]*?\*/')
-
-                    # Check for and replace copyright notices that are multi-line comments
-                    if re.match(re_multi_line_comment, content):
-                        print_debug(f"Replaced multi-line copyright declaration in {file_path}.")
-                        content = re.sub(re_multi_line_comment, f'{copyright_pattern}', content, count=1)
-                    else:
-                        print_warning(f"Add copyright declaration found at the beginning of {file_path}.")
-                        content = f'{copyright_pattern}\n' + content
-
-                    # Write the modified content back to the file
-                    with open(file_path, 'w', encoding='utf-8') as file:
-                        file.write(content)
+        self.job_config = job_config
+        self.expect_license = job_config[LICENSE_FOR_NEW_FILES]
+        self.include_path = job_config.get(INCLUDE_PATH, [])
+
+        full_template = job_config[ESPRESSIF_COPYRIGHT_FULL]
+        short_template = job_config.get(ESPRESSIF_COPYRIGHT_SHORT)
+        # Jobs with the same license, template and include paths share LICENSE lookups
+        self.license_key = (self.expect_license, full_template, tuple(self.include_path))
+
+        self.year = year
+        self.templates = {False: full_template, True: short_template}  # Keyed by copyright type (SHORT mode)
+        self.declarations = {}  # (copyright type, comment style name) -> (declaration, its UTF-8 bytes, allowed license it contains), rendered on first use
+        self.copyright_regexes = {}  # (copyright type, comment style name) -> regex with any year, compiled on first use
+        self.license_file_text = format_license_file(full_template).strip().format(license=self.expect_license, year=year).strip()
+
+        # One alternation finds the allowed licenses and the license for new files in a single
+        # pass over the header; the SPDX identifier and the copyright year are only looked up
+        # when a file fails, to explain why
+        self.allowed_licenses = job_config[ALLOWED_LICENSE]
+        # Allow spaces or - to connect words
+        new_license_words = self.expect_license.split(" ")
+        self.scan_patterns = {
+            SCAN_ALLOWED: [re.compile(re.escape(license_name)) for license_name in self.allowed_licenses],
+            SCAN_NEW_LICENSE: [re.compile(r"[\s-]".join(new_license_words))],  # 允许空格或 - 作为连接符
+        }
+
+        # Factor out the literal prefix shared by every notice, so that the regex engine can
+        # skip ahead to it instead of trying each alternative at every position
+        prefix = re.match(r'\w*', os.path.commonprefix(list(self.allowed_licenses) + [new_license_words[0]])).group()
+        alternatives = [re.escape(license_name[len(prefix):]) for license_name in self.allowed_licenses]
+        alternatives.append(r"[\s-]".join([new_license_words[0][len(prefix):]] + new_license_words[1:]))
+        self.header_regex = re.compile(prefix + '(?:' + '|'.join(alternatives) + ')')
+
+        # The same scan on raw header bytes, so that files that pass are never decoded
+        self.byte_header_regex = re.compile(self.header_regex.pattern.encode('utf-8'))
+        self.byte_scan_patterns = {item: [re.compile(pattern.pattern.encode('utf-8')) for pattern in patterns] for item, patterns in self.scan_patterns.items()}
+
+
+    def scan_header(self, content):
+        """
+        Find the first allowed license and license for new files in a header.
 
-            except FileNotFoundError:
-                print_error(f"{file_path} not found.")
-            except Exception as e:
-                print_error(f"Error processing {file_path}: {e}")
+        The combined alternation visits every position where any of the notices starts, and
+        only at those positions are the individual patterns tried, so overlapping notices
+        (e.g. an allowed license that is also the license for new files) are all found.
 
+        Args:
+            content (str or bytes): Header content, or raw header bytes.
 
-    def get_copyright_pattern(self, file_path):
+        Returns:
+            dict: Matched text per scan item (SCAN_ALLOWED, SCAN_NEW_LICENSE), None if absent.
         """
-        Get the copyright template corresponding to a file.
+        if isinstance(content, bytes):
+            header_regex, scan_patterns = self.byte_header_regex, self.byte_scan_patterns
+        else:
+            header_regex, scan_patterns = self.header_regex, self.scan_patterns
+        found = dict.fromkeys(scan_patterns)
+        pending = [item for item, patterns in scan_patterns.items() if patterns]
+        position = 0
+        while pending:
+            match = header_regex.search(content, position)
+            if match is None:
+                break
+            position = match.start()
+            for item in list(pending):
+                for pattern in scan_patterns[item]:
+                    item_match = pattern.match(content, position)
+                    if item_match is not None:
+                        found[item] = item_match.group()
+                        if isinstance(found[item], bytes):
+                            found[item] = found[item].decode('utf-8', 'replace')
+                        pending.remove(item)
+                        break
+            position += 1
+        return found
+
+
+    def get_declaration(self, copyright_type, comment_style):
+        """
+        Get the SHORT or FULL copyright declaration of the current year in a comment style.
+
+        Args:
+            copyright_type (bool): Whether SHORT mode is used.
+            comment_style (BlockCommentStyle or LineCommentStyle): Comment style of the file.
 
         Returns:
-            tuple[bool, str]: Whether SHORT mode is used, and the template string.
+            tuple[str, bytes, str]: Expected copyright declaration, the same encoded as UTF-8,
+            and the allowed license it contains (None if it contains none, so a file is not
+            compliant just by matching it).
         """
-        self.job_config = self.get_config(self.config, file_path)  # 通过get_config函数获取相应的配置
+        declaration = self.declarations.get((copyright_type, comment_style.name))
+        if declaration is None:
+            text = self.format_copyright(copyright_type, self.year, comment_style)
+            declaration = (text, text.encode('utf-8'), self.scan_header(text)[SCAN_ALLOWED])
+            self.declarations[(copyright_type, comment_style.name)] = declaration
+        return declaration
 
-        if self.job_config is None:
-            return None, None
 
-        copyright_type = self.check_license_file(file_path)
-        if copyright_type:
-            copyright_pattern = self.job_config[ESPRESSIF_COPYRIGHT_SHORT].format(license=self.job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
-        else:
-            copyright_pattern = self.job_config[ESPRESSIF_COPYRIGHT_FULL].format(license=self.job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
+    def format_copyright(self, copyright_type, year, comment_style):
+        """
+        Format the SHORT or FULL copyright declaration with a year or year range.
 
-        copyright_pattern = copyright_pattern.strip()
-        return copyright_type, copyright_pattern
+        Args:
+            copyright_type (bool): Whether SHORT mode is used.
+            year (str): Year or year range, e.g. "2021-2024".
+            comment_style (BlockCommentStyle or LineCommentStyle): Comment style of the file.
+
+        Returns:
+            str: Expected copyright declaration.
+        """
+        return comment_style.render(self.templates[bool(copyright_type)]).format(license=self.expect_license, year=year).strip()
 
 
-    def check_copyright(self, file_path):
+    def get_copyright_regex(self, copyright_type, comment_style):
         """
-        Check if the copyright declaration at the top of a file is compliant.
+        Get a regex matching the SHORT or FULL copyright declaration with any year or year range.
 
         Returns:
-            bool: Whether it's compliant.
+            re.Pattern: Regex with the years in the `year` group, if the template has a year.
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-
-                copyright_type, copyright_pattern = self.get_copyright_pattern(file_path)
-                if copyright_pattern is not None:
-                    copyright_pattern_escape = re.escape(copyright_pattern)  # 对版权声明进行转义以便匹配
-
-                    # Check that the license statement is correct
-                    for license_name in self.job_config[ALLOWED_LICENSE]:
-                        license_pattern = re.escape(license_name)
-                        if re.search(license_pattern, content):
-                            break
-                    else:
-                        print_error(f"The license declaration format of {file_path} is incorrect")
-                        if copyright_type:
-                            self.invalid_copyright_short_set.add(file_path)
-                        else:
-                            self.invalid_copyright_full_set.add(file_path)
-                        return False
-
-                    license_for_new_files = self.job_config[LICENSE_FOR_NEW_FILES]
-                    # Modification: Allow spaces or - to connect words
-                    license_for_new_files = license_for_new_files.replace(" ", r"[\s-]")  # 允许空格或 - 作为连接符
-
-                    # Check that the license in the file matches and the copyright notice is in place
-                    if re.search(license_for_new_files, content):
-                        if not re.search(copyright_pattern_escape, content, re.DOTALL):
-                            print_debug(f"The copyright declaration format of {file_path} is incorrect")
-                            if copyright_type:
-                                self.invalid_copyright_short_set.add(file_path)
-                            else:
-                                self.invalid_copyright_full_set.add(file_path)
-                            return False
+        regex = self.copyright_regexes.get((copyright_type, comment_style.name))
+        if regex is None:
+            marker = '\0'
+            parts = [re.escape(part) for part in self.format_copyright(copyright_type, marker, comment_style).split(marker)]
+            pattern = parts[0]
+            for index, part in enumerate(parts[1:]):
+                # Every occurrence of {year} must carry the same years
+                pattern += (f'(?P<year>{YEAR_RANGE_PATTERN})' if index == 0 else '(?P=year)') + part
+            regex = re.compile(pattern)
+            self.copyright_regexes[(copyright_type, comment_style.name)] = regex
+        return regex
+
+
+def format_year_range(first_year, last_year):
+    """
+    Format a copyright year range, a single year if both ends are the same.
+    """
+    return str(first_year) if first_year == last_year else f"{first_year}-{last_year}"
 
-        except FileNotFoundError:
-            print_error(f"{file_path} file not found")
-            return False
-        except Exception as e:
-            print_warning(f"Error occurred while checking {file_path}: {e}")
-            return False
 
-        return True
+def unwrap_block_comment(template):
+    """
+    Get the text lines of a `/* ... */` template, without the comment delimiters and leading `*`.
 
+    Args:
+        template (str): Copyright template from the configuration.
 
-    def process(self):
+    Returns:
+        list[str] or None: Text lines, None if the template is not a block comment.
+    """
+    lines = template.strip().splitlines()
+    if len(lines) < 2 or lines[0].strip() != '/*' or lines[-1].strip() != '*/':
+        return None
+    text_lines = []
+    for line in lines[1:-1]:
+        line = line.strip()
+        if line.startswith('*'):
+            line = line[1:]
+        text_lines.append(line[1:] if line.startswith(' ') else line)
+    return text_lines
+
+
+class BlockCommentStyle:
+    """
+    `/* ... */` block comments, the style the templates of the configuration are written in.
+    """
+    name = 'c'
+
+
+    def render(self, template):
         """
-        Main process: handles the list of input files, performs checks or replacements.
+        Render a copyright template in this comment style.
         """
-        if not self.new_file:
-            # Get a list of newly added files in the current commit
-            self.new_file = get_commit_file()
+        return template
 
-        if not self.new_file:
-            print_error("There are no new files in the current commit.")
-            sys.exit(0)
 
-        for file_path in self.new_file:
-            # Check if the path is a folder
-            if os.path.isdir(file_path):
-                # If it is a folder, get all the files in the folder
-                print_debug(f"Processing directory: {file_path}")
-                new_files_in_dir = self.get_file_in_directory(file_path)
-                for new_file in new_files_in_dir:
-                    if not self.check_copyright(new_file):
-                        self.check_result = False
-            elif os.path.isfile(file_path):
-                # Check if the file extension is in the list of supported extensions
-                if any(file_path.endswith(ext) for ext in self.valid_extensions):
-                    if not self.check_copyright(file_path):
-                        self.check_result = False
+    def find_header(self, data):
+        """
+        Find the leading comment block, the declaration compared by the check and replaced by `--replace`.
+
+        Matches the same span as `[\s\S]?/\*[\s\S]*?\*/` anchored at the start of the file.
+
+        Args:
+            data (str or bytes): File content, or at least its header.
+
+        Returns:
+            tuple[int, int]: Offset where the declaration starts, and offset just past the
+            closing `*/` (None if the file does not start with a comment).
+        """
+        opening, closing = (b'/*', b'*/') if isinstance(data, bytes) else ('/*', '*/')
+        comment_start = data.find(opening, 0, 3)
+        if comment_start == -1:
+            return 0, None
+        comment_end = data.find(closing, comment_start + 2)
+        if comment_end == -1:
+            return 0, None
+        return 0, comment_end + 2
+
+
+    def ends_in_comment(self, data):
+        """
+        Check whether a truncated header (str or bytes) ends inside an unterminated `/* ... */` comment.
+        """
+        opening, closing = (b'/*', b'*/') if isinstance(data, bytes) else ('/*', '*/')
+        comment_start = data.rfind(opening)
+        return comment_start != -1 and data.find(closing, comment_start + 2) == -1
+
+
+class LineCommentStyle:
+    """
+    Comments made of consecutive lines starting with a marker, such as `#`, `//` or `;`.
+    """
+    def __init__(self, name, markers, shebang = False):
+        """
+        Args:
+            name (str): Style name, as used in the `comment_styles` configuration.
+            markers (tuple[str]): Line comment markers, templates are rendered with the first one.
+            shebang (bool): Whether a leading `#!` line and a PEP 263 encoding line may precede the declaration.
+        """
+        self.name = name
+        self.markers = markers
+        self.byte_markers = tuple(marker.encode('ascii') for marker in markers)
+        self.shebang = shebang
+        self.coding_regex = re.compile(CODING_LINE_PATTERN)
+        self.byte_coding_regex = re.compile(CODING_LINE_PATTERN.encode('ascii'))
+
+
+    def render(self, template):
+        """
+        Render a copyright template in this comment style.
+
+        Block comment templates are converted line by line, other templates are used as written.
+        """
+        text_lines = unwrap_block_comment(template)
+        if text_lines is None:
+            return template
+        marker = self.markers[0]
+        return '\n'.join(f"{marker} {line}" if line else marker for line in text_lines)
+
+
+    def find_header(self, data):
+        """
+        Find the leading block of comment lines, the declaration compared by the check and replaced by `--replace`.
+
+        Args:
+            data (str or bytes): File content, or at least its header.
+
+        Returns:
+            tuple[int, int]: Offset where the declaration starts (after a shebang line and an encoding
+            line), and offset of the end of the last comment line (None if the file does not start with a comment).
+        """
+        if isinstance(data, bytes):
+            markers, newline, carriage_return, shebang, coding_regex = self.byte_markers, b'\n', b'\r', b'#!', self.byte_coding_regex
+        else:
+            markers, newline, carriage_return, shebang, coding_regex = self.markers, '\n', '\r', '#!', self.coding_regex
+
+        position = 0
+        if self.shebang:
+            # The encoding declaration only takes effect on the first two lines, so it is kept above the copyright
+            if data.startswith(shebang):
+                position = data.find(newline) + 1
+                if position == 0:
+                    return len(data), None
+            if coding_regex.match(data, position):
+                position = data.find(newline, position) + 1
+                if position == 0:
+                    return len(data), None
+        header_start = position
+        header_end = None
+        while data.startswith(markers, position):
+            line_end = data.find(newline, position)
+            if line_end == -1:
+                return header_start, len(data)
+            header_end = line_end - 1 if data[line_end - 1:line_end] == carriage_return else line_end
+            position = line_end + 1
+        return header_start, header_end
+
+
+    def ends_in_comment(self, data):
+        """
+        Check whether a truncated header (str or bytes) is all comment lines, so the comment may go on after it.
+        """
+        _, header_end = self.find_header(data)
+        return header_end is not None and header_end >= len(data.rstrip(b'\r\n' if isinstance(data, bytes) else '\r\n'))
+
+
+COMMENT_STYLES = {  # Style name -> comment style
+    'c': BlockCommentStyle(),
+    'hash': LineCommentStyle('hash', ('#',), shebang = True),
+    'slash': LineCommentStyle('slash', ('//',)),
+    'asm': LineCommentStyle('asm', (';', '@')),
+}
+
+
+def read_file_at(file_fd, offset, size = None):
+    """
+    Read from an open file at an offset without moving its position, with `os.pread` where available.
+
+    Args:
+        file_fd (int): File descriptor.
+        offset (int): Offset of the first byte.
+        size (int): Number of bytes, None to read to the end of the file.
+
+    Returns:
+        bytes: Data read, shorter than `size` at the end of the file.
+    """
+    if size is not None:
+        if hasattr(os, 'pread'):
+            return os.pread(file_fd, size, offset)
+        os.lseek(file_fd, offset, os.SEEK_SET)
+        return os.read(file_fd, size)
+
+    chunks = []
+    while True:
+        chunk = read_file_at(file_fd, offset, max(os.fstat(file_fd).st_size - offset, FILE_READ_SIZE))
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+        offset += len(chunk)
+
+
+def write_file_atomic(file_path, data):
+    """
+    Replace the content of a file through a temporary file and `os.replace`, so that an
+    interrupted write never leaves a truncated file behind. The file mode is preserved,
+    and a symbolic link is followed so that its target is replaced, not the link itself.
+
+    Args:
+        file_path (str): Target file path.
+        data (bytes): New file content.
+    """
+    file_path = os.path.realpath(file_path)
+    try:
+        file_mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        file_mode = None
+
+    # Unique per process and thread, so concurrent writers never share a temporary file
+    temp_path = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600 if file_mode is None else file_mode)
+    try:
+        with os.fdopen(temp_fd, 'wb') as file:
+            file.write(data)
+            if file_mode is not None and hasattr(os, 'fchmod'):
+                # The mode given to os.open is reduced by the umask
+                os.fchmod(file.fileno(), file_mode)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def walk_tree(directory, is_ignored_dir, log_pruned = False):
+    """
+    Walk a directory tree lazily with `os.scandir`, in the same order as `os.walk`.
+
+    Directories matching an `ignore` glob are pruned without being entered and, like
+    `os.walk`, symbolic links to directories are not followed.
+
+    Args:
+        directory (str): Root of the tree.
+        is_ignored_dir (Callable[[str], bool]): Whether a directory is ignored.
+        log_pruned (bool): Whether to log the pruned and unreadable directories, off for the
+            periodic rescans of --watch.
+
+    Yields:
+        tuple[str, list[os.DirEntry]]: Each directory and the files directly inside it.
+    """
+    if is_ignored_dir(directory):
+        if log_pruned:
+            print_debug(f"Skipping ignored directory: {directory}")
+        return
+    pending_dirs = [directory]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        sub_dirs = []
+        files = []
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry)
+                    elif entry.is_symlink():
+                        continue
+                    elif is_ignored_dir(entry.path):
+                        if log_pruned:
+                            print_debug(f"Skipping ignored directory: {entry.path}")
+                    else:
+                        sub_dirs.append(entry.path)
+        except OSError as e:
+            if log_pruned:
+                print_debug(f"Cannot list directory {current_dir}: {e}")
+            continue
+        yield current_dir, files
+        # Visit sub-directories depth first in listing order
+        pending_dirs.extend(reversed(sub_dirs))
+
+
+def iter_delimited_paths(stream, separator):
+    """
+    Split a binary stream of paths into paths as the data arrives.
+
+    Args:
+        stream (BinaryIO): Buffered binary stream, e.g. `sys.stdin.buffer`.
+        separator (bytes): Path separator, a NUL character or a newline.
+
+    Yields:
+        str: Paths, decoded with the file system encoding.
+    """
+    pending = b''
+    # read1 returns what is available instead of waiting for a full buffer
+    for chunk in iter(lambda: stream.read1(PATH_STREAM_READ_SIZE), b''):
+        paths = (pending + chunk).split(separator)
+        pending = paths.pop()
+        for path in paths:
+            if separator == b'\n':
+                path = path.rstrip(b'\r')
+            if path:
+                yield os.fsdecode(path)
+    if separator == b'\n':
+        pending = pending.rstrip(b'\r')
+    if pending:
+        yield os.fsdecode(pending)
+
+
+def as_walk_path(path):
+    """
+    Prefix a relative path with `./` like the paths of a walk of the current directory,
+    so that include globs such as `**/examples/**` match listed and walked files the same way.
+
+    Absolute paths and paths already starting with `./` or `../` are returned unchanged.
+    """
+    if os.path.isabs(path) or path.startswith(('./', '../')) or path in (os.curdir, os.pardir):
+        return path
+    return os.path.join(os.curdir, path)
+
+
+def iter_git_paths(args):
+    """
+    Stream the NUL-separated paths printed by a Git command (`git ls-files -z`, `git diff -z --name-only`).
+
+    Args:
+        args (List[str]): Git command and arguments.
+
+    Yields:
+        str: Paths as soon as Git prints them, normalized with `as_walk_path`.
+    """
+    import subprocess
+    process = subprocess.Popen(['git'] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for path in iter_delimited_paths(process.stdout, b'\0'):
+            yield as_walk_path(path)
+        error = process.stderr.read()
+        if process.wait() != 0:
+            print_error(f"Error occurred while listing files with `git {args[0]}`: {error.decode('utf-8', 'replace').strip()}")
+            sys.exit(1)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def find_work_tree(start_dir='.'):
+    """
+    Find the top level of the Git working tree containing a directory, the nearest directory with a `.git` entry.
+
+    Returns:
+        str or None: Absolute path of the top level, None outside a repository.
+    """
+    current_dir = os.path.abspath(start_dir)
+    while True:
+        if os.path.exists(os.path.join(current_dir, '.git')):
+            return current_dir
+        if current_dir == os.path.dirname(current_dir):
+            return None
+        current_dir = os.path.dirname(current_dir)
+
+
+def find_git_dir(start_dir='.'):
+    """
+    Find the Git directory of the repository containing a directory.
+
+    In linked worktrees and submodules `.git` is a file whose `gitdir:` line names the Git directory.
+
+    Returns:
+        str or None: Path of the Git directory, None outside a repository.
+    """
+    work_tree = find_work_tree(start_dir)
+    if work_tree is None:
+        return None
+    git_dir = os.path.join(work_tree, '.git')
+    if os.path.isdir(git_dir):
+        return git_dir
+    try:
+        with open(git_dir, encoding='utf-8') as git_file:
+            first_line = git_file.readline()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not first_line.startswith('gitdir:'):
+        return None
+    # A relative path is relative to the directory holding the `.git` file
+    git_dir = os.path.join(work_tree, first_line[len('gitdir:'):].strip())
+    return os.path.normpath(git_dir) if os.path.isdir(git_dir) else None
+
+
+class ResultCache:
+    """
+    Persistent cache of the files that passed `check_copyright`.
+
+    An entry records the size and modification time of a file when it passed, with the
+    verdict key of the check (matched job, comment style and a digest of the expected
+    declaration). A file whose entry still matches is not read again. Files modified less
+    than `RESULT_CACHE_RACY_NS` before they were checked are not recorded, since a later
+    change within the same timestamp tick would go unnoticed.
+
+    Entries are spread over `RESULT_CACHE_SHARDS` files by path hash, so a run only loads
+    and rewrites the shards of the files it checks. A shard is dropped when its fingerprint
+    (configuration content, current year and cache version) changes, and its least
+    recently used entries are evicted beyond its share of `max_entries`.
+    """
+    def __init__(self, cache_dir, fingerprint, max_entries = RESULT_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            cache_dir (str): Directory of the shard files.
+            fingerprint (str): Fingerprint of everything the cached verdicts depend on.
+            max_entries (int): Maximum number of cached files.
+        """
+        import zlib
+        self.crc32 = zlib.crc32
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.shard_max_entries = max(1, max_entries // RESULT_CACHE_SHARDS)
+        self.shards = {}  # shard number -> OrderedDict of absolute path -> [size, mtime_ns, verdict key], oldest first
+        self.dirty_shards = set()
+        self.updates = {}  # Entries added or used since the cache was opened
+        self.hits = 0
+
+
+    def get_shard(self, file_path):
+        """
+        Get the entries of the shard a file belongs to, reading the shard file on first use.
+
+        A missing, corrupted or stale shard file is ignored.
+        """
+        shard = self.crc32(file_path.encode('utf-8', 'surrogateescape')) % RESULT_CACHE_SHARDS
+        entries = self.shards.get(shard)
+        if entries is not None:
+            return shard, entries
+        entries = self.shards[shard] = collections.OrderedDict()
+        shard_path = os.path.join(self.cache_dir, f"{shard:02x}.json")
+        try:
+            with open(shard_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return shard, entries
+        if not isinstance(data, dict) or data.get('fingerprint') != self.fingerprint:
+            print_debug(f"Result cache shard {shard_path} is stale, discarding it.")
+            return shard, entries
+        for cached_path, size, mtime_ns, verdict in data.get('entries', []):
+            entries[cached_path] = [size, mtime_ns, verdict]
+        return shard, entries
+
+
+    def is_clean(self, file_path, verdict, stat):
+        """
+        Check whether a file passed the same check before and is unchanged since then.
+
+        Args:
+            file_path (str): Absolute file path.
+            verdict (str): Verdict key of the check, see `LicenseChecker.get_cache_verdict`.
+            stat (os.stat_result): Current status of the file.
+
+        Returns:
+            bool: Whether the file can be skipped.
+        """
+        shard, entries = self.get_shard(file_path)
+        entry = entries.get(file_path)
+        if entry is None or entry != [stat.st_size, stat.st_mtime_ns, verdict]:
+            return False
+        entries.move_to_end(file_path)
+        self.dirty_shards.add(shard)
+        self.updates[file_path] = entry
+        self.hits += 1
+        return True
+
+
+    def record(self, file_path, verdict, stat):
+        """
+        Record that a file passed the check, unless it was modified too recently to be trusted.
+        """
+        if stat.st_mtime_ns >= time.time_ns() - RESULT_CACHE_RACY_NS:
+            return
+        entry = [stat.st_size, stat.st_mtime_ns, verdict]
+        self.merge_updates({file_path: entry})
+        self.updates[file_path] = entry
+
+
+    def merge_updates(self, updates):
+        """
+        Apply the entries recorded by another cache instance (e.g. of a worker process).
+        """
+        for file_path, entry in updates.items():
+            shard, entries = self.get_shard(file_path)
+            entries[file_path] = entry
+            entries.move_to_end(file_path)
+            self.dirty_shards.add(shard)
+
+
+    def save(self):
+        """
+        Evict the least recently used entries and write the modified shards atomically.
+        """
+        for shard in sorted(self.dirty_shards):
+            entries = self.shards[shard]
+            while len(entries) > self.shard_max_entries:
+                entries.popitem(last=False)
+            data = {
+                'fingerprint': self.fingerprint,
+                'entries': [[file_path] + entry for file_path, entry in entries.items()],
+            }
+            shard_path = os.path.join(self.cache_dir, f"{shard:02x}.json")
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                write_file_atomic(shard_path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            except OSError as e:
+                print_warning(f"Could not write result cache {shard_path}: {e}")
+                return
+        self.dirty_shards.clear()
+
+
+class ConfigSnapshot:
+    """
+    Parsed configuration files stored with `marshal`, which loads them without PyYAML.
+
+    Each entry is keyed by the absolute path of a configuration file and records the
+    SHA-256 of its content. While the size, modification time and inode of the file are
+    unchanged, the entry is used without reading the file. A file modified shortly before
+    its entry was recorded is hashed again, since an edit within the resolution of the
+    modification time would otherwise go unnoticed.
+    """
+    def __init__(self, snapshot_path):
+        """
+        Load the snapshots from disk.
+
+        Args:
+            snapshot_path (str): Path to the snapshot file, None to keep no snapshots.
+        """
+        self.snapshot_path = snapshot_path
+        self.entries = {}  # absolute config path -> {'stat', 'recorded_ns', 'sha256', 'config'}
+        if snapshot_path is None:
+            return
+        try:
+            with open(snapshot_path, 'rb') as file:
+                data = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        if isinstance(data, dict) and data.get('version') == CONFIG_SNAPSHOT_VERSION:
+            self.entries = data['entries']
+
+
+    def load(self, config_path):
+        """
+        Get a parsed configuration file, from the snapshot when it is up to date.
+
+        Args:
+            config_path (str): Path to the configuration file.
+
+        Returns:
+            tuple[str, dict]: SHA-256 of the file content and the parsed configuration.
+        """
+        config_path = os.path.abspath(config_path)
+        config_stat = os.stat(config_path)
+        stat_key = [config_stat.st_size, config_stat.st_mtime_ns, config_stat.st_ino]
+        entry = self.entries.get(config_path)
+        if entry is not None and entry['stat'] == stat_key and config_stat.st_mtime_ns < entry['recorded_ns'] - CONFIG_SNAPSHOT_RACY_NS:
+            return entry['sha256'], entry['config']
+
+        import hashlib
+        with open(config_path, 'rb') as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry['sha256'] == digest:
+            config = entry['config']
+        else:
+            import yaml
+            config = yaml.safe_load(data.decode('utf-8'))
+
+        self.entries[config_path] = {'stat': stat_key, 'recorded_ns': time.time_ns(), 'sha256': digest, 'config': config}
+        self.save()
+        return digest, config
+
+
+    def save(self):
+        """
+        Write the snapshots atomically, skipping configurations `marshal` cannot store.
+        """
+        if self.snapshot_path is None:
+            return
+        try:
+            data = marshal.dumps({'version': CONFIG_SNAPSHOT_VERSION, 'entries': self.entries})
+        except ValueError as e:
+            print_debug(f"Configuration cannot be snapshotted: {e}")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            write_file_atomic(self.snapshot_path, data)
+        except OSError as e:
+            print_warning(f"Could not write configuration snapshot {self.snapshot_path}: {e}")
+
+
+class GitYearIndex:
+    """
+    First and last commit years of the files of a Git repository.
+
+    The years of every file come from one streaming `git log --name-only` pass over the
+    whole history. The index is stored in the cache directory with the commit it was built
+    at, and a later run only reads the commits added since, when HEAD moved forward. Files
+    with uncommitted changes, and files without history, are last modified in the current
+    year. Renames are not followed, so the history of a renamed file starts at the rename.
+    """
+    def __init__(self, current_year):
+        """
+        Args:
+            current_year (int): Year of uncommitted changes.
+        """
+        self.current_year = current_year
+        self.top_level = None  # Root of the working tree
+        self.head = None  # Commit the index was built at, None without commits
+        self.years = {}  # path relative to the top level -> [first year, last year]
+        self.modified = set()  # Paths with uncommitted changes
+
+
+    def run_git(self, *args, check = True):
+        import subprocess
+        return subprocess.run(['git'] + list(args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=check)
+
+
+    def build(self, cache_path):
+        """
+        Load the stored index and bring it up to date with HEAD and the working tree.
+
+        Args:
+            cache_path (str): Path to the stored index, None to not store it.
+
+        Raises:
+            subprocess.CalledProcessError: Not inside a Git working tree.
+        """
+        self.top_level = os.fsdecode(self.run_git('rev-parse', '--show-toplevel').stdout.rstrip(b'\n'))
+        head = self.run_git('rev-parse', '--verify', '--quiet', 'HEAD', check=False).stdout.strip().decode() or None
+
+        stored_head = None
+        if cache_path is not None:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+                if data.get('version') == GIT_YEARS_VERSION:
+                    stored_head, self.years = data['head'], data['years']
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if head != stored_head:
+            if head is None:
+                self.years = {}
+            elif stored_head is not None and self.run_git('merge-base', '--is-ancestor', stored_head, head, check=False).returncode == 0:
+                print_debug(f"Reading the Git history since {stored_head[:12]}.")
+                self.read_log(f"{stored_head}..{head}")
+            else:
+                print_debug("Reading the whole Git history.")
+                self.years = {}
+                self.read_log(head)
+            self.save(cache_path, head)
+        self.head = head
+
+        if head is not None:
+            output = self.run_git('diff', 'HEAD', '--name-only', '--no-renames', '-z').stdout
+            self.modified = set(os.fsdecode(output).split('\0')[:-1])
+
+
+    def read_log(self, revisions):
+        """
+        Record the years of the files changed by some commits, streaming the `git log` output.
+
+        Args:
+            revisions (str): Commit or commit range given to `git log`.
+        """
+        import subprocess
+
+        # Every commit is "\x01<year>\0\n<path>\0<path>\0...", merges list no paths
+        process = subprocess.Popen(
+            ['git', 'log', '--no-renames', '--name-only', '-z', '--format=%x01%ad', '--date=format:%Y', revisions],
+            stdout=subprocess.PIPE
+        )
+        years = self.years
+        year = None
+        pending = b''
+        for chunk in iter(lambda: process.stdout.read(GIT_LOG_READ_SIZE), b''):
+            fields = (pending + chunk).split(b'\0')
+            pending = fields.pop()
+            for field in fields:
+                if field.startswith(b'\x01'):
+                    year = int(field[1:])
+                    continue
+                path = os.fsdecode(field[1:] if field.startswith(b'\n') else field)
+                entry = years.get(path)
+                if entry is None:
+                    years[path] = [year, year]
+                elif year < entry[0]:
+                    entry[0] = year
+                elif year > entry[1]:
+                    entry[1] = year
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, 'git log')
+
+
+    def save(self, cache_path, head):
+        """
+        Write the index atomically.
+        """
+        if cache_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            write_file_atomic(cache_path, json.dumps({'version': GIT_YEARS_VERSION, 'head': head, 'years': self.years}, separators=(',', ':')).encode('utf-8'))
+        except OSError as e:
+            print_warning(f"Could not write Git year index {cache_path}: {e}")
+
+
+    def get_years(self, file_path):
+        """
+        Get the year a file was first committed and the year it was last modified.
+
+        Args:
+            file_path (str): File path relative to the current directory.
+
+        Returns:
+            tuple[int, int]: First and last year.
+        """
+        real_path = os.path.join(os.path.realpath(os.path.dirname(file_path) or '.'), os.path.basename(file_path))
+        path = os.path.relpath(real_path, self.top_level).replace(os.sep, '/')
+        entry = self.years.get(path)
+        if entry is None:
+            return self.current_year, self.current_year
+        if path in self.modified:
+            return entry[0], self.current_year
+        return entry[0], entry[1]
+
+
+class GitBlobReader:
+    """
+    Read staged file contents through a single long-lived `git cat-file --batch` process.
+    """
+    def __init__(self):
+        import subprocess
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+
+
+    def read(self, file_path):
+        """
+        Get the content of a file as staged in the Git index.
+
+        Args:
+            file_path (str): File path relative to the current directory.
+
+        Returns:
+            bytes: Staged file content.
+        """
+        self.process.stdin.write(f":./{file_path}\n".encode('utf-8', 'surrogateescape'))
+        self.process.stdin.flush()
+        # The reply is "<oid> blob <size>\n<content>\n", or "<object> missing\n"
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise FileNotFoundError(f"{file_path} is not staged")
+        content = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return content
+
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def create_report(report_format, stream):
+    """
+    Create the report writer of a --format value.
+
+    Returns:
+        JsonLinesReport or SarifReport or None: The writer, None for the text format.
+    """
+    if report_format == 'jsonl':
+        from check_copyright_report import JsonLinesReport
+        return JsonLinesReport(stream)
+    if report_format == 'sarif':
+        from check_copyright_report import SarifReport
+        return SarifReport(stream)
+    return None
+
+
+class LicenseChecker:
+    """
+    Used to check whether the LICENSE and copyright declaration of newly added files
+    comply with company specifications, and automatically fix non-compliant content
+    based on configuration.
+    """
+    def __init__(self, config_path = 'check_copyright_config.yaml', file = [], replace = False, jobs = 1, use_cache = False, staged = False, stats = False, git_years = False, shard = None, report = None, file_source = None):
+        """
+        Initialize the checker instance.
+
+        Args:
+            config_path (str): Path to the YAML configuration file.
+            file (List[str]): List of file paths to check.
+            replace (bool): Whether to enable automatic fixing.
+            jobs (int): Number of worker processes used to check large file sets.
+            use_cache (bool): Whether to skip files that passed in a previous run and are unchanged.
+            staged (bool): Whether to check the staged content of the files added or modified in the Git index.
+            stats (bool): Whether to record per-phase timings and counters in `stats`.
+            git_years (bool): Whether copyright years must match the Git history of each file instead of the current year.
+            shard (tuple[int, int]): Check only shard INDEX of COUNT (1-based) of the discovered files, None for all files.
+            report (JsonLinesReport or SarifReport): Writer receiving a record per checked file, None for log output only.
+            file_source (Iterator[str]): Stream of paths to check instead of `file` (--from-stdin, --tracked, --changed-since).
+        """
+        self.config_path = config_path
+        self.compiled_jobs = {}  # id(job_config) -> CompiledJob
+        self.result_caches = {}  # (cache directory, fingerprint) -> ResultCache, kept across runs of a warm checker
+        self.cache_verdicts = {}  # (id of job configuration, copyright type, comment style name) -> verdict key of the result cache
+        self.license_indexes = {}  # index file path -> LicenseIndex, kept across runs of a warm checker
+        self.current_year = datetime.now().year
+
+        start_time = time.perf_counter()
+        self.config_digest = None  # SHA-256 of the configuration file, set by load_config
+        self.config = self.load_config(config_path)
+        self.rule_matcher = RuleMatcher(self.config)
+        self.comment_styles = self.get_comment_styles()  # extension -> comment style
+        self.valid_extensions = set(self.comment_styles)
+        config_load_time = time.perf_counter() - start_time
+
+        self.reset(file = file, replace = replace, jobs = jobs, use_cache = use_cache, staged = staged, stats = stats, git_years = git_years, shard = shard, report = report, file_source = file_source)
+        if self.stats is not None:
+            self.stats.add_phase('config_load', config_load_time)
+
+
+    def reset(self, file = [], replace = False, jobs = 1, use_cache = False, staged = False, stats = False, git_years = False, shard = None, report = None, file_source = None):
+        """
+        Prepare the checker for a run, keeping the configuration, compiled rules and result caches.
+
+        LICENSE lookups are not kept, as LICENSE files may have changed since the last run.
+
+        Args:
+            file (List[str]): List of file paths to check.
+            replace (bool): Whether to enable automatic fixing.
+            jobs (int): Number of worker processes used to check large file sets.
+            use_cache (bool): Whether to skip files that passed in a previous run and are unchanged.
+            staged (bool): Whether to check the staged content of the files added or modified in the Git index.
+            stats (bool): Whether to record per-phase timings and counters in `stats`.
+            git_years (bool): Whether copyright years must match the Git history of each file instead of the current year.
+            shard (tuple[int, int]): Check only shard INDEX of COUNT (1-based) of the discovered files, None for all files.
+            report (JsonLinesReport or SarifReport): Writer receiving a record per checked file, None for log output only.
+            file_source (Iterator[str]): Stream of paths to check instead of `file` (--from-stdin, --tracked, --changed-since).
+        """
+        self.stats = RunStats() if stats else None
+        self.license_cache = LicenseCache()
+        self.job_config = ''
+        self.compiled_job = None
+        self.comment_style = None  # Comment style of the file last matched by get_copyright_pattern
+        self.header_bytes = None  # Raw header bytes last read by read_header
+        self.fix_plans = {}  # file path -> (expected declaration, replaced header bytes), filled with --replace
+        self.new_file = file
+        self.replace = replace
+        self.jobs = jobs
+        self.check_result = True
+        self.invalid_license_file_set = set()
+        self.invalid_copyright_full_set = set()
+        self.invalid_copyright_short_set = set()
+        self.staged = staged
+        self.blob_reader = None
+        self.git_years = git_years
+        self.year_index = None  # GitYearIndex, built by process with --git-years
+        self.license_index = None  # LicenseIndex, opened by process once built with `check-copyright index`
+        self.shard = shard
+        self.shard_summary = None  # Files and weight of the shard, set by select_shard
+        self.report = report
+        self.file_source = file_source
+        self.file_record = {}  # Report record of the file last checked by check_copyright
+        # Cached verdicts describe working tree files, not staged content
+        self.use_cache = use_cache and not staged
+        self.result_cache = self.open_result_cache() if self.use_cache else None
+
+
+    def open_year_index(self):
+        """
+        Build the Git year index used by --git-years, stored in the cache directory.
+        """
+        start_time = time.perf_counter()
+        git_dir = find_git_dir()
+        self.year_index = GitYearIndex(self.current_year)
+        try:
+            self.year_index.build(os.path.join(git_dir, RESULT_CACHE_DIR, GIT_YEARS_FILE) if git_dir is not None else None)
+        except Exception as e:
+            print_error(f"Error occurred while reading the Git history: {e}")
+            sys.exit(1)
+        if self.stats is not None:
+            self.stats.add_phase('git_history', time.perf_counter() - start_time)
+
+
+    def open_license_index(self, rebuild = False, create = False):
+        """
+        Open the license index of the current Git repository and bring it up to date.
+
+        Args:
+            rebuild (bool): Read the whole Git tree again.
+            create (bool): Build the index if it does not exist yet, otherwise only an existing index is used.
+
+        Returns:
+            LicenseIndex or None: The index, None when not inside a Git repository or without an index.
+        """
+        git_dir = find_git_dir()
+        if git_dir is None:
+            return None
+        index_path = os.path.join(git_dir, RESULT_CACHE_DIR, LICENSE_INDEX_FILE)
+        if not create and not os.path.isfile(index_path):
+            return None
+
+        fingerprint = f"{self.config_digest}:{LICENSE_INDEX_VERSION}"
+        license_index = self.license_indexes.get(index_path)
+        if license_index is None or license_index.fingerprint != fingerprint:
+            from check_copyright_index import LicenseIndex
+            license_index = LicenseIndex(find_work_tree(), fingerprint)
+            self.license_indexes[index_path] = license_index
+        try:
+            license_index.refresh(index_path, self.rule_matcher, self.valid_extensions, rebuild)
+        except Exception as e:
+            print_warning(f"Could not update the license index {index_path}: {e}")
+            return None
+        return license_index
+
+
+    def open_result_cache(self):
+        """
+        Open the persistent result cache of the current Git repository.
+
+        Returns:
+            ResultCache or None: The cache, None when not inside a Git repository.
+        """
+        git_dir = find_git_dir()
+        if git_dir is None:
+            print_debug("Not inside a Git repository, the result cache is disabled.")
+            return None
+
+        cache_path = os.path.join(git_dir, RESULT_CACHE_DIR, RESULT_CACHE_SHARD_DIR)
+        fingerprint = f"{self.config_digest}:{self.current_year}:{RESULT_CACHE_VERSION}"
+        if self.git_years:
+            fingerprint += ":git-years"
+        result_cache = self.result_caches.get((cache_path, fingerprint))
+        if result_cache is not None:
+            result_cache.updates = {}
+            result_cache.hits = 0
+            return result_cache
+
+        result_cache = ResultCache(cache_path, fingerprint)
+        self.result_caches[(cache_path, fingerprint)] = result_cache
+        return result_cache
+
+
+    def load_config(self, config_path='check_copyright_config.yaml'):
+        """
+        Load configuration from a YAML file.
+
+        Inside a Git repository the parsed configuration is kept in a snapshot in the cache
+        directory, so later runs neither import PyYAML nor parse the file again. Also sets
+        `config_digest`.
+
+        Args:
+            config_path (str): Path to the configuration file.
+
+        Returns:
+            dict: Configuration contents (rules for each job name).
+        """
+        git_dir = find_git_dir()
+        snapshot = ConfigSnapshot(os.path.join(git_dir, RESULT_CACHE_DIR, CONFIG_SNAPSHOT_FILE) if git_dir is not None else None)
+        self.config_digest, config = snapshot.load(config_path)
+        return config
+
+
+    def get_comment_styles(self):
+        """
+        Build the table dispatching file extensions to comment styles.
+
+        The built-in EXTENSION_COMMENT_STYLES can be extended or overridden with a
+        `comment_styles` mapping (extension: style name) in the DEFAULT configuration.
+
+        Returns:
+            dict: Lowercase extension -> BlockCommentStyle or LineCommentStyle.
+        """
+        style_names = dict(EXTENSION_COMMENT_STYLES)
+        for extension, style_name in self.config.get('DEFAULT', {}).get(COMMENT_STYLES_KEY, {}).items():
+            style_names[extension.lower()] = style_name
+
+        comment_styles = {}
+        for extension, style_name in style_names.items():
+            if style_name not in COMMENT_STYLES:
+                print_error(f"Unknown comment style '{style_name}' for {extension} files, expected one of {list(COMMENT_STYLES)}")
+                sys.exit(1)
+            comment_styles[extension] = COMMENT_STYLES[style_name]
+        return comment_styles
+
+
+    def get_comment_style(self, file_path):
+        """
+        Get the comment style of a file from its extension, `/* ... */` for unknown extensions.
+        """
+        return self.comment_styles.get(os.path.splitext(file_path)[1].lower(), COMMENT_STYLES['c'])
+
+
+    def print_copyright(self):
+        """
+        Print standard LICENSE and copyright templates for reference.
+        """
+        for job_name, job_config in self.config.items():
+            # self.process_job(job_name, job_config)
+            if job_name != 'ignore':
+                espressif_copyright_full = job_config.get(ESPRESSIF_COPYRIGHT_FULL, 'Default Full').format(license=job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
+                espressif_copyright_short = job_config.get(ESPRESSIF_COPYRIGHT_SHORT, 'Default Short').format(license=job_config[LICENSE_FOR_NEW_FILES], year=self.current_year)
+                include = job_config.get(INCLUDE_PATH, '')
+                print_info(f"Processing job: {job_name}")
+                print_warning(f"The content of the LICENSE file under this path should be as follows: {include}")
+                print_warning(f"Espressif LICENSE file:")
+                print_info(f"{self.format_license_file(espressif_copyright_full).strip()}\n")
+                print_warning(f"Espressif Copyright Full:")
+                print_info(f"{espressif_copyright_full}")
+                print_warning(f"Espressif Copyright Short:")
+                print_info(f"{espressif_copyright_short}")
+                print_warning('-' * 50)
+
+
+    def get_invalid_license_file_set(self):
+        return self.invalid_license_file_set
+
+
+    def get_invalid_copyright_full_set(self):
+        return self.invalid_copyright_full_set
+
+
+    def get_invalid_copyright_short_set(self):
+        return self.invalid_copyright_short_set
+
+
+    def get_commit_file(self):
+        """
+        Get newly added files from the current commit (via `git diff`).
+
+        Returns:
+            list[str]: List of added file paths.
+        """
+        import subprocess
+        try:
+            result = subprocess.run(
+                ['git', 'diff', '--name-status', 'HEAD~1', 'HEAD'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True
+            )
+            new_files = [
+                line.split('\t')[1]
+                for line in result.stdout.splitlines()
+                if line.startswith('A')
+            ]
+            return new_files
+        except subprocess.CalledProcessError as e:
+            print_error(f"Error occurred while retrieving newly added files: {e}")
+            sys.exit(1)
+
+
+    def get_staged_files(self):
+        """
+        Get the files added or modified in the Git index (via `git diff --cached`).
+
+        Renames are not detected, so a renamed file is reported by its new path as an added file.
+
+        Returns:
+            list[str]: List of staged file paths, relative to the current directory.
+        """
+        import subprocess
+        try:
+            result = subprocess.run(
+                ['git', 'diff', '--cached', '-z', '--name-status', '--relative', '--no-renames', '--diff-filter=AM'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True
+            )
+        except subprocess.CalledProcessError as e:
+            print_error(f"Error occurred while retrieving staged files: {e}")
+            sys.exit(1)
+
+        # The output is a sequence of NUL-terminated "status", "path" pairs
+        fields = result.stdout.decode('utf-8', 'surrogateescape').split('\0')
+        return fields[1:-1:2]
+
+
+    def get_file_in_directory(self, directory):
+        """
+        Get all source code files with valid extensions under the directory.
+
+        The tree is walked lazily by `walk_tree`, pruning the ignored directories.
+
+        Args:
+            directory (str): Path to the directory.
+
+        Yields:
+            str: File paths.
+        """
+        for _, file_entries in walk_tree(directory, self.is_ignored_dir, log_pruned = True):
+            for entry in file_entries:
+                # Get the extension and convert it to lowercase
+                if os.path.splitext(entry.name)[1].lower() in self.valid_extensions:
+                    yield entry.path
+
+
+    def is_ignored_dir(self, directory):
+        """
+        Check whether every file below a directory is ignored, from the license index when it has the directory.
+        """
+        if self.license_index is not None:
+            try:
+                return self.license_index.is_ignored_dir(directory)
+            except KeyError:
+                pass
+        return self.rule_matcher.is_ignored_dir(directory)
+
+
+    def get_config(self, config, target_file_path):
+        """
+        Get the rule configuration that matches a specific file path.
+
+        Args:
+            config (dict): All configuration data.
+            target_file_path (str): File path to match.
+
+        Returns:
+            dict or None: Matched rule configuration.
+        """
+        if config is not self.config:
+            return RuleMatcher(config).match(target_file_path)
+        if self.license_index is not None:
+            try:
+                return self.rule_matcher.get_merged_config(self.license_index.get_rule_key(target_file_path))
+            except KeyError:
+                pass
+        return self.rule_matcher.match(target_file_path)
+
+
+    def generate_license_text(self, license_name, copyright_template):
+        """
+        Generate the formatted license text.
+        """
+        formatted_copyright = copyright_template.format(license=license_name, year=self.current_year)
+        indented_copyright = '\n'.join(f'{line}' for line in formatted_copyright.splitlines())
+        license_text = f"""{indented_copyright}"""
+        return license_text
+
+
+    def merge_configs(self, default_config, special_config):
+        """
+        Merge the DEFAULT and specific job configuration, prioritizing job settings.
+
+        Returns:
+            dict: Merged configuration.
+        """
+        return merge_configs(default_config, special_config)
+
+
+    def format_license_file(self, input_string):
+        """
+        Format the LICENSE template (remove the first three characters of each line).
+
+        Args:
+            input_string (str): Original template string.
+
+        Returns:
+            str: Processed LICENSE content.
+        """
+        return format_license_file(input_string)
+
+
+    def check_license_file(self, file_path):
+        """
+        Check whether a LICENSE file exists and whether the content matches the template.
+
+        Args:
+            file_path (str): Path to a source file (used to search upward for LICENSE).
+
+        Returns:
+            bool: Whether it matches the requirements.
+        """
+        license_path, verdict = self.resolve_license_file(os.path.dirname(file_path))
+
+        if license_path is None:
+            print_debug("No LICENSE file found in any parent directory.")
+            return False
+
+        if verdict == LICENSE_MISMATCH:
+            print_warning(f"LICENSE in {os.path.dirname(license_path)} does not match expected license.")
+            return False
+
+        return True
+
+
+    def resolve_license_file(self, current_dir):
+        """
+        Find the LICENSE file that governs a directory under the current job configuration.
+
+        The walk result of every directory visited is cached, so sibling and child
+        directories resolved later stop at the first directory already known.
+
+        Args:
+            current_dir (str): Directory to start searching upward from.
+
+        Returns:
+            tuple[str, str]: LICENSE file path and its verdict, or (None, None) if no LICENSE applies.
+        """
+        exit_flag = False  # Marks whether to match any include path
+        include_path = self.compiled_job.include_path
+        job_key = self.compiled_job.license_key
+        visited = []
+        result = (None, None)
+
+        while current_dir != os.path.dirname(current_dir):  # 循环直到到达根目录
+            state = (job_key, current_dir, exit_flag)
+            cached = self.license_cache.resolved.get(state)
+            if cached is not None:
+                self.license_cache.hits += 1
+                result = cached
+                break
+            visited.append(state)
+
+            license_path = self.license_cache.find_license_file(current_dir)
+            if license_path is not None:
+                result = (license_path, self.get_license_verdict(license_path))
+                break
+
+            if exit_flag:
+                break
+
+            # Check if it is the root directory of the Git repository, and stop searching if it is
+            if self.license_cache.is_git_root(current_dir):
+                print_debug(f"Reached git repo at {current_dir}. Stopping search.")
+                break
+
+            # If not in the include list, exit
+            if not all(fnmatch.fnmatch(current_dir, path_index) for path_index in include_path):
+                exit_flag = True
+
+            # Move up one directory
+            current_dir = os.path.dirname(current_dir)
+
+        for state in visited:
+            self.license_cache.resolved[state] = result
+        return result
+
+
+    def iter_license_map(self, license_index):
+        """
+        Resolve the job, governing LICENSE file, verdict and template of every indexed directory.
+
+        The current directory must be the top level of the repository, directories are
+        resolved like the files found by a walk of `.`.
+
+        Args:
+            license_index (LicenseIndex): Index of the repository.
+
+        Yields:
+            tuple[str, str, str, str, str]: Directory, job name, LICENSE path (None if none applies), verdict and template ('full' or 'short'), for each job of the files of the directory.
+        """
+        self.license_index = self.license_cache.index = license_index
+        for dir_key in sorted(license_index.dirs):
+            directory = f'./{dir_key}' if dir_key else os.curdir
+            entry = license_index.dirs[dir_key]
+            for job_id in sorted(set(entry[3].values()) | set(entry[4].values())):
+                self.job_config = self.rule_matcher.get_merged_config(license_index.jobs[job_id])
+                if self.job_config is None:
+                    continue
+                self.compiled_job = self.get_compiled_job(self.job_config)
+                license_path, verdict = self.resolve_license_file(directory)
+                template = 'short' if license_path is not None and verdict != LICENSE_MISMATCH else 'full'
+                yield directory, self.rule_matcher.get_job_name(self.job_config), license_path, verdict, template
+
+
+    def get_license_verdict(self, license_path):
+        """
+        Compare a LICENSE file with the expected license and template of the current job.
+
+        Each LICENSE file is read and compared once per job configuration; an incorrectly
+        formatted LICENSE is recorded in `invalid_license_file_set` the first time it is seen.
+
+        Args:
+            license_path (str): Path to the LICENSE file.
+
+        Returns:
+            str: LICENSE_VALID, LICENSE_INVALID_FORMAT or LICENSE_MISMATCH.
+        """
+        expect_license = self.compiled_job.expect_license
+        expect_copyright = self.compiled_job.license_file_text
+
+        verdict_key = (license_path, expect_license, expect_copyright)
+        verdict = self.license_cache.verdicts.get(verdict_key)
+        if verdict is not None:
+            return verdict
+
+        verdict = self.license_index.get_verdict(license_path, expect_license, expect_copyright) if self.license_index is not None else None
+        if verdict is not None:
+            print_debug(f"LICENSE file {license_path} is unchanged, verdict from the license index: {verdict}")
+        else:
+            print_debug(f"Found LICENSE file at: {license_path}")
+            license_file = self.license_cache.read_license_file(license_path)
+            license_dir = os.path.dirname(license_path)
+
+            # Check that the LICENSE content contains the expected license notice
+            if expect_license in license_file:
+                print_debug(f"LICENSE file in {license_dir} matches expected license: {expect_license}")
+                # Check if the copyright format is correct
+                if expect_copyright == license_file.strip():
+                    print_debug(f"LICENSE file format of {license_path} is correct.")
+                    verdict = LICENSE_VALID
+                else:
+                    print_debug(f"LICENSE file format of {license_path} is incorrect.")
+                    verdict = LICENSE_INVALID_FORMAT
+            else:
+                verdict = LICENSE_MISMATCH
+            if self.license_index is not None:
+                self.license_index.set_verdict(license_path, expect_license, expect_copyright, verdict)
+
+        if verdict == LICENSE_INVALID_FORMAT:
+            if self.report is not None and license_path not in self.invalid_license_file_set:
+                self.report.write({'type': 'license', 'path': license_path, 'result': FILE_FAILED, 'license': expect_license, 'reason': "the LICENSE file differs from the LICENSE file template"})
+            self.invalid_license_file_set.add(license_path)
+            self.add_fix_plan(license_path, expect_copyright + "\n", None)
+            self.check_result = False
+
+        self.license_cache.verdicts[verdict_key] = verdict
+        return verdict
+
+
+    def replace_copyright(self, file_path):
+        """
+        Automatically replace the copyright declaration
+        (including LICENSE files and comment blocks in source files).
+
+        Uses the fix plan captured while checking the file when there is one, otherwise
+        derives the expected declaration again.
+
+        Args:
+            file_path (str): Target file path.
+        """
+        for print_message, message in self.apply_fix(file_path, self.get_fix_plan(file_path)):
+            print_message(message)
+
+
+    def replace_files(self, file_paths):
+        """
+        Fix many files at once, writing them on a thread pool.
+
+        Args:
+            file_paths (list[str]): Target file paths, messages are reported in this order.
+        """
+        import concurrent.futures
+        fix_plans = [(file_path, self.get_fix_plan(file_path)) for file_path in file_paths]
+        with concurrent.futures.ThreadPoolExecutor(REWRITE_THREADS) as executor:
+            # Starting threads is not worth it for a handful of files
+            if len(fix_plans) < REWRITE_THREADS:
+                results = map(lambda fix_plan: self.apply_fix(*fix_plan), fix_plans)
+            else:
+                results = executor.map(lambda fix_plan: self.apply_fix(*fix_plan), fix_plans)
+            for messages in results:
+                for print_message, message in messages:
+                    print_message(message)
+
+
+    def get_fix_plan(self, file_path):
+        """
+        Get how a non-compliant file is to be fixed.
+
+        Returns:
+            tuple[str, bytes] or None: Expected declaration (or LICENSE text) and the header bytes
+            it replaces (None to insert it at the top), None if the file is not checked.
+        """
+        fix_plan = self.fix_plans.get(file_path)
+        if fix_plan is not None:
+            return fix_plan
+
+        # Not captured while checking, e.g. when called directly
+        if os.path.basename(file_path) == LICENSE_FILE_NAME:
+            self.job_config = self.get_config(self.config, file_path)
+            if self.job_config is None:
+                return None
+            self.compiled_job = self.get_compiled_job(self.job_config)
+            return (self.compiled_job.license_file_text + "\n", None)
+
+        copyright_type, copyright_pattern = self.get_copyright_pattern(file_path)
+        if copyright_pattern is None:
+            return None
+        return (copyright_pattern, None)
+
+
+    def add_fix_plan(self, file_path, copyright_pattern, header_bytes):
+        """
+        Remember how to fix a non-compliant file, so `--replace` does not check it again.
+
+        Args:
+            file_path (str): File path.
+            copyright_pattern (str): Expected copyright declaration.
+            header_bytes (bytes or None): Header read while checking.
+        """
+        if not self.replace:
+            return
+        header_prefix = None
+        if header_bytes is not None:
+            _, header_end = self.get_comment_style(file_path).find_header(header_bytes)
+            if header_end is not None:
+                header_prefix = bytes(header_bytes[:header_end])
+        self.fix_plans[file_path] = (copyright_pattern, header_prefix)
+
+
+    def apply_fix(self, file_path, fix_plan):
+        """
+        Write the fixed content of a file. Safe to run on several threads at once.
+
+        Returns:
+            list[tuple[Callable, str]]: Print function and message pairs to report.
+        """
+        if fix_plan is None:
+            return []
+        copyright_pattern, header_prefix = fix_plan
+        try:
+            if os.path.basename(file_path) == LICENSE_FILE_NAME:
+                write_file_atomic(file_path, copyright_pattern.encode('utf-8'))
+                return [(print_warning, f"Replaced incorrect license in: {file_path}")]
+
+            with open(file_path, 'rb') as file:
+                data = file.read()
+
+            # The header captured during the check is reused if the file did not change since
+            comment_style = self.get_comment_style(file_path)
+            if header_prefix is not None and data.startswith(header_prefix):
+                header_start, header_end = comment_style.find_header(header_prefix)
+            else:
+                header_start, header_end = comment_style.find_header(data)
+
+            # The declaration is written with the line ending of the file, taken from its first line
+            first_newline = data.find(b'\n')
+            line_ending = b'\r\n' if first_newline > 0 and data[first_newline - 1] == 0x0d else b'\n'
+            declaration = copyright_pattern.encode('utf-8').replace(b'\n', line_ending)
+
+            # Check for and replace copyright notices that are multi-line comments
+            if header_end is not None:
+                message = (print_debug, f"Replaced multi-line copyright declaration in {file_path}.")
+                data = data[:header_start] + declaration + data[header_end:]
+            else:
+                message = (print_warning, f"Add copyright declaration found at the beginning of {file_path}.")
+                data = data[:header_start] + declaration + line_ending + data[header_start:]
+
+            # Write the modified content back to the file
+            write_file_atomic(file_path, data)
+            return [message]
+
+        except FileNotFoundError:
+            return [(print_error, f"{file_path} not found.")]
+        except Exception as e:
+            return [(print_error, f"Error processing {file_path}: {e}")]
+
+
+    def get_copyright_pattern(self, file_path):
+        """
+        Get the copyright template corresponding to a file.
+
+        Returns:
+            tuple[bool, str]: Whether SHORT mode is used, and the template string.
+        """
+        if self.stats is not None:
+            start_time = time.perf_counter()
+        self.job_config = self.get_config(self.config, file_path)  # 通过get_config函数获取相应的配置
+        if self.stats is not None:
+            self.stats.add_phase('rule_matching', time.perf_counter() - start_time)
+
+        if self.job_config is None:
+            return None, None
+
+        self.compiled_job = self.get_compiled_job(self.job_config)
+        if self.stats is not None:
+            start_time = time.perf_counter()
+            license_stats = self.license_cache.get_stats()
+        copyright_type = self.check_license_file(file_path)
+        if self.stats is not None:
+            self.stats.add_phase('license_lookup', time.perf_counter() - start_time)
+            self.stats.count('stat_calls', self.license_cache.get_stats()['probes'] - license_stats['probes'])
+        if copyright_type and self.compiled_job.templates[True] is None:
+            raise KeyError(ESPRESSIF_COPYRIGHT_SHORT)
+        self.comment_style = self.get_comment_style(file_path)
+        copyright_pattern, _, _ = self.compiled_job.get_declaration(bool(copyright_type), self.comment_style)
+
+        return copyright_type, copyright_pattern
+
+
+    def get_compiled_job(self, job_config):
+        """
+        Get the compiled form of a job configuration, compiling it on first use.
+
+        Args:
+            job_config (dict): Merged job configuration returned by `get_config`.
+
+        Returns:
+            CompiledJob: Formatted templates and compiled regular expressions.
+        """
+        compiled_job = self.compiled_jobs.get(id(job_config))
+        if compiled_job is None:
+            compiled_job = CompiledJob(job_config, self.current_year)
+            # The compiled job keeps job_config alive, so its id is not reused
+            self.compiled_jobs[id(job_config)] = compiled_job
+        return compiled_job
+
+
+    def read_header(self, file_path):
+        """
+        Read the header window of a file, where the copyright declaration is expected.
+
+        Only the first `header_window_bytes` bytes (and at most `header_window_lines` lines)
+        are read, with a single `pread`; the whole file is read only when the window ends
+        inside a comment block. The header is not decoded, see `decode_header`.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            bytes: Raw header bytes.
+        """
+        if self.stats is not None:
+            start_time = time.perf_counter()
+        window_bytes = self.job_config.get(HEADER_WINDOW_BYTES, DEFAULT_HEADER_WINDOW_BYTES)
+        window_lines = self.job_config.get(HEADER_WINDOW_LINES, 0)
+
+        if self.blob_reader is not None:
+            blob = self.blob_reader.read(file_path)
+            read_at = lambda offset, size = None: blob[offset:] if size is None else blob[offset:offset + size]
+            file_fd = None
+        else:
+            file_fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            read_at = lambda offset, size = None: read_file_at(file_fd, offset, size)
+
+        try:
+            if not window_bytes:
+                data = read_at(0)
+                bytes_read = len(data)
+            else:
+                window = read_at(0, window_bytes)
+                bytes_read = len(window)
+                data = b''.join(window.splitlines(keepends=True)[:window_lines]) if window_lines else window
+                if len(window) == window_bytes and self.comment_style.ends_in_comment(data):
+                    print_debug(f"Header window of {file_path} ends inside a comment, reading the whole file.")
+                    rest = read_at(window_bytes)
+                    bytes_read += len(rest)
+                    data = window + rest
+        finally:
+            if file_fd is not None:
+                os.close(file_fd)
+
+        self.header_bytes = data
+        if self.stats is not None:
+            self.stats.count('bytes_read', bytes_read)
+            self.stats.add_phase('file_reads', time.perf_counter() - start_time)
+        return data
+
+
+    def decode_header(self, data):
+        """
+        Decode a header read by `read_header`, for the checks that need text.
+
+        Bytes that are not valid UTF-8 (e.g. a Latin-1 author name) are replaced instead of
+        failing the check, and a multi-byte character cut at the end of the window is dropped.
+
+        Returns:
+            str: Header content with universal newlines.
+        """
+        content = codecs.getincrementaldecoder('utf-8')('replace').decode(data)
+        return content.replace('\r\n', '\n').replace('\r', '\n')
+
+
+    def check_copyright(self, file_path):
+        """
+        Check if the copyright declaration at the top of a file is compliant.
+
+        The outcome is also described in `file_record`, for the report.
+
+        Returns:
+            bool: Whether it's compliant.
+        """
+        record = self.file_record = {'type': 'file', 'path': file_path, 'result': FILE_PASSED, 'job': None, 'template': None, 'license': None, 'reason': None, 'cached': False}
+        try:
+            copyright_type, copyright_pattern = self.get_copyright_pattern(file_path)
+            if copyright_pattern is None:
+                record['result'] = FILE_IGNORED
+            else:
+                record['job'] = self.rule_matcher.get_job_name(self.job_config)
+                record['template'] = 'short' if copyright_type else 'full'
+                if self.result_cache is not None:
+                    cache_key = os.path.abspath(file_path)
+                    cache_verdict = self.get_cache_verdict(file_path, copyright_type, copyright_pattern)
+                    file_stat = os.stat(file_path)
+                    if self.stats is not None:
+                        self.stats.count('stat_calls')
+                    if self.result_cache.is_clean(cache_key, cache_verdict, file_stat):
+                        record['cached'] = True
+                        return True
+
+                header = self.read_header(file_path)
+
+                if self.stats is not None:
+                    start_time = time.perf_counter()
+                    check_result = self.check_content(file_path, header, copyright_type, copyright_pattern)
+                    self.stats.add_phase('regex_checks', time.perf_counter() - start_time)
+                else:
+                    check_result = self.check_content(file_path, header, copyright_type, copyright_pattern)
+
+                if not check_result:
+                    record['result'] = FILE_FAILED
+                    return False
+
+                if self.result_cache is not None:
+                    self.result_cache.record(cache_key, cache_verdict, file_stat)
+
+        except FileNotFoundError:
+            print_error(f"{file_path} file not found")
+            record.update(result = FILE_ERROR, reason = "file not found")
+            return False
+        except Exception as e:
+            print_warning(f"Error occurred while checking {file_path}: {e}")
+            record.update(result = FILE_ERROR, reason = str(e))
+            return False
+
+        return True
+
+
+    def get_cache_verdict(self, file_path, copyright_type, copyright_pattern):
+        """
+        Get the key a file's verdict is cached under: the matched job, the comment style and
+        a digest of the expected declaration, plus the Git years of the file with `--git-years`.
+
+        A cached pass is only reused for the same key, so a file matched by another job (e.g.
+        reached through another path) or rendered in another style is checked again.
+
+        Returns:
+            str: Verdict key.
+        """
+        verdict_id = (id(self.job_config), bool(copyright_type), self.comment_style.name)
+        verdict = self.cache_verdicts.get(verdict_id)
+        if verdict is None:
+            digest = self.result_cache.crc32(copyright_pattern.encode('utf-8'))
+            verdict = f"{self.rule_matcher.get_job_name(self.job_config)}:{self.comment_style.name}:{int(bool(copyright_type))}:{digest:08x}"
+            self.cache_verdicts[verdict_id] = verdict
+        if self.year_index is not None:
+            first_year, last_year = self.year_index.get_years(file_path)
+            verdict = f"{verdict}:{first_year}-{last_year}"
+        return verdict
+
+
+    def check_content(self, file_path, header, copyright_type, copyright_pattern):
+        """
+        Check the header of a file against the current job.
+
+        The raw bytes are checked first, against the encoded declaration and with the
+        license scan; the header is only decoded when it does not pass that way (to explain
+        why, or for a declaration with other line endings) and when its years come from
+        the Git history.
+
+        Args:
+            file_path (str): File path, used for reporting.
+            header (bytes): Header read by `read_header`.
+            copyright_type (bool): Whether SHORT mode is used.
+            copyright_pattern (str): Expected copyright declaration.
+
+        Returns:
+            bool: Whether it's compliant.
+        """
+        if self.year_index is not None:
+            # The years of the declaration come from the Git history of the file. Fixing the
+            # declaration modifies the file, so the fixed range ends with the current year.
+            first_year, last_year = self.year_index.get_years(file_path)
+            copyright_pattern = self.compiled_job.format_copyright(copyright_type, format_year_range(first_year, self.current_year), self.comment_style)
+        else:
+            # Most files start with exactly the expected declaration, which is settled by
+            # comparing it with the leading comment block, without scanning the header
+            _, encoded_pattern, declared_license = self.compiled_job.get_declaration(bool(copyright_type), self.comment_style)
+            header_start, header_end = self.comment_style.find_header(header)
+            if declared_license is not None and header_end is not None and header_end - header_start == len(encoded_pattern) and header.startswith(encoded_pattern, header_start):
+                self.file_record['license'] = declared_license
+                return True
+
+            scan_result = self.compiled_job.scan_header(header)
+            if scan_result[SCAN_ALLOWED] is not None and (scan_result[SCAN_NEW_LICENSE] is None or encoded_pattern in header):
+                self.file_record['license'] = scan_result[SCAN_ALLOWED]
+                return True
+
+        content = self.decode_header(header)
+        scan_result = self.compiled_job.scan_header(content)
+        self.file_record['license'] = scan_result[SCAN_ALLOWED]
+
+        # Check that the license statement is correct
+        if scan_result[SCAN_ALLOWED] is None:
+            spdx_match = SPDX_IDENTIFIER_REGEX.search(content)
+            if spdx_match is not None:
+                reason = f"SPDX-License-Identifier is '{spdx_match.group(1)}', allowed licenses are {self.compiled_job.allowed_licenses}"
+            else:
+                reason = f"none of the allowed licenses {self.compiled_job.allowed_licenses} was found"
+            print_error(f"The license declaration format of {file_path} is incorrect: {reason}")
+            self.file_record['reason'] = reason
+            self.add_fix_plan(file_path, copyright_pattern, self.header_bytes)
+            if copyright_type:
+                self.invalid_copyright_short_set.add(file_path)
+            else:
+                self.invalid_copyright_full_set.add(file_path)
+            return False
+
+        # Check that the license in the file matches and the copyright notice is in place
+        if scan_result[SCAN_NEW_LICENSE] is not None:
+            if self.year_index is not None:
+                reason = self.check_year_range(content, copyright_type, first_year, last_year)
+            elif copyright_pattern in content:
+                reason = None
+            else:
+                year_match = COPYRIGHT_YEAR_REGEX.search(content)
+                if year_match is not None and year_match.group(1) != str(self.current_year):
+                    reason = f"copyright year is {year_match.group(1)}, expected {self.current_year}"
+                else:
+                    reason = f"found '{scan_result[SCAN_ALLOWED]}' but the text differs from the {'SHORT' if copyright_type else 'FULL'} template"
+
+            if reason is not None:
+                print_debug(f"The copyright declaration format of {file_path} is incorrect: {reason}")
+                self.file_record['reason'] = reason
+                self.add_fix_plan(file_path, copyright_pattern, self.header_bytes)
+                if copyright_type:
+                    self.invalid_copyright_short_set.add(file_path)
+                else:
+                    self.invalid_copyright_full_set.add(file_path)
+                return False
+
+        return True
+
+
+    def check_year_range(self, content, copyright_type, first_year, last_year):
+        """
+        Check the copyright declaration of a file against the years of its Git history.
+
+        The declared years must cover the history: a range may start before the first
+        commit (e.g. for code copied from elsewhere) but must end with or after the last
+        modification, and not in the future.
+
+        Args:
+            content (str): Header content.
+            copyright_type (bool): Whether SHORT mode is used.
+            first_year (int): Year the file was first committed.
+            last_year (int): Year the file was last modified.
+
+        Returns:
+            str or None: Why the declaration is incorrect, None if it is correct.
+        """
+        match = self.compiled_job.get_copyright_regex(copyright_type, self.comment_style).search(content)
+        if match is None:
+            return f"the text differs from the {'SHORT' if copyright_type else 'FULL'} template"
+        if 'year' not in match.re.groupindex:
+            return None
+
+        start_year, _, end_year = match.group('year').partition('-')
+        start_year = int(start_year)
+        end_year = int(end_year or start_year)
+        if start_year <= first_year and last_year <= end_year <= self.current_year and start_year <= end_year:
+            return None
+        return f"copyright year is {match.group('year')}, expected {format_year_range(first_year, last_year)} from the Git history"
+
+
+    def check_file(self, file_path):
+        """
+        Check a file with `check_copyright`, recording its total time when statistics are enabled
+        and writing its record when a report is requested.
+
+        Returns:
+            bool: Whether it's compliant.
+        """
+        if self.stats is None and self.report is None:
+            return self.check_copyright(file_path)
+
+        start_time = time.perf_counter()
+        check_result = self.check_copyright(file_path)
+        elapsed = time.perf_counter() - start_time
+        if self.stats is not None:
+            self.stats.add_file(file_path, elapsed)
+        if self.report is not None:
+            self.file_record['seconds'] = round(elapsed, 6)
+            self.report.write(self.file_record)
+        return check_result
+
+
+    def iter_timed(self, file_paths):
+        """
+        Wrap a file iterator so the time spent discovering files is recorded.
+        """
+        file_paths = iter(file_paths)
+        while True:
+            start_time = time.perf_counter()
+            file_path = next(file_paths, None)
+            self.stats.add_phase('file_discovery', time.perf_counter() - start_time)
+            if file_path is None:
+                return
+            yield file_path
+
+
+    def collect_files(self):
+        """
+        Expand the input paths into the files to be checked, in checking order.
+
+        Returns:
+            Iterator[str]: File paths.
+        """
+        for file_path in self.new_file:
+            # Check if the path is a folder
+            if os.path.isdir(file_path):
+                # If it is a folder, get all the files in the folder
+                print_debug(f"Processing directory: {file_path}")
+                yield from self.get_file_in_directory(file_path)
+            elif os.path.isfile(file_path):
+                # Check if the file extension is in the list of supported extensions
+                if os.path.splitext(file_path)[1].lower() in self.valid_extensions:
+                    yield file_path
 
                 # If it is a LICENSE file, get all supported file extensions in the directory
                 elif os.path.basename(file_path) == LICENSE_FILE_NAME:
-                    print_debug(f"Found LICENSE file in {root}. Now checking files with extensions {self.valid_extensions} in this directory.")
-                    if not self.check_copyright(file_path):
-                        self.check_result = False
+                    print_debug(f"Found LICENSE file in {os.path.dirname(file_path)}. Now checking files with extensions {self.valid_extensions} in this directory.")
+                    yield file_path
+
+
+    def collect_listed_files(self, file_paths):
+        """
+        Select the files to be checked from a stream of file paths.
+
+        Like a directory walk, only files with a checked extension are kept (LICENSE files
+        are found through the files they govern). Paths are filtered by extension and by
+        ignored directory as they arrive, so nothing is opened or stat'ed for the paths
+        that are skipped.
+
+        Args:
+            file_paths (Iterable[str]): Paths, e.g. from stdin or `git ls-files`.
+
+        Yields:
+            str: File paths.
+        """
+        ignored_dirs = {}  # directory -> whether it is ignored, the files of a directory usually arrive together
+        for file_path in file_paths:
+            if os.path.splitext(file_path)[1].lower() not in self.valid_extensions:
+                continue
+            directory = os.path.dirname(file_path)
+            is_ignored = ignored_dirs.get(directory)
+            if is_ignored is None:
+                is_ignored = ignored_dirs[directory] = self.is_ignored_dir(directory)
+            if not is_ignored:
+                yield file_path
+
+
+    def collect_staged_files(self):
+        """
+        Select the staged files to be checked.
+
+        Returns:
+            Iterator[str]: File paths.
+        """
+        for file_path in self.new_file:
+            if os.path.splitext(file_path)[1].lower() in self.valid_extensions or os.path.basename(file_path) == LICENSE_FILE_NAME:
+                yield file_path
+
+
+    def check_files_parallel(self, file_paths):
+        """
+        Check files on a pool of worker processes.
+
+        Files are sent to the workers in chunks, and the log messages and invalid file sets
+        of each chunk are merged back in input order, so the output matches a serial run.
+
+        Args:
+            file_paths (Iterable[str]): Files to check.
+        """
+        import multiprocessing
+        chunks = iter(lambda: list(itertools.islice(file_paths, PARALLEL_CHUNK_SIZE)), [])
+        with multiprocessing.Pool(self.jobs, initializer=_init_worker, initargs=(self.config_path, self.replace, self.use_cache, self.stats is not None, logging.getLogger().level, self.year_index, self.license_index, self.report is not None)) as pool:
+            for chunk_result in pool.imap(_check_chunk, chunks):
+                for level, message in chunk_result['logs']:
+                    logging.log(level, message)
+                for record in chunk_result['report_records']:
+                    # Every worker reports the incorrect LICENSE files it finds, keep the first report
+                    if record['type'] == 'license' and record['path'] in self.invalid_license_file_set:
+                        continue
+                    self.report.write(record)
+                self.invalid_license_file_set.update(chunk_result['invalid_license_files'])
+                self.invalid_copyright_full_set.update(chunk_result['invalid_copyright_full'])
+                self.invalid_copyright_short_set.update(chunk_result['invalid_copyright_short'])
+                self.fix_plans.update(chunk_result['fix_plans'])
+                if not chunk_result['check_result']:
+                    self.check_result = False
+                self.license_cache.merge_stats(chunk_result['license_cache_stats'])
+                if self.stats is not None:
+                    self.stats.merge(chunk_result['stats'])
+                if self.result_cache is not None:
+                    self.result_cache.merge_updates(chunk_result['result_cache_updates'])
+                    self.result_cache.hits += chunk_result['result_cache_hits']
+
+
+    def rewrite_files(self, file_paths):
+        """
+        Fix files with `replace_files`, recording the time when statistics are enabled.
+        """
+        if self.stats is None:
+            self.replace_files(file_paths)
+            return
+
+        start_time = time.perf_counter()
+        self.replace_files(file_paths)
+        self.stats.add_phase('rewrites', time.perf_counter() - start_time)
 
 
+    def process(self):
+        """
+        Main process: handles the list of input files, performs checks or replacements.
+        """
+        if self.staged:
+            # Check exactly what is being committed
+            self.new_file = self.get_staged_files()
+            if not self.new_file:
+                print_info("There are no staged files to check.")
+                return
+            file_paths = self.collect_staged_files()
+        elif self.file_source is not None:
+            file_paths = self.collect_listed_files(self.file_source)
+        else:
+            if not self.new_file:
+                # Get a list of newly added files in the current commit
+                self.new_file = self.get_commit_file()
+
+            if not self.new_file:
+                print_error("There are no new files in the current commit.")
+                sys.exit(0)
+
+            file_paths = self.collect_files()
+
+        if self.git_years:
+            self.open_year_index()
+
+        # Like the result cache, the index is not used for staged content
+        if self.use_cache:
+            if self.stats is not None:
+                start_time = time.perf_counter()
+            self.license_index = self.license_cache.index = self.open_license_index()
+            if self.stats is not None:
+                self.stats.add_phase('license_lookup', time.perf_counter() - start_time)
+
+        if self.stats is not None:
+            file_paths = self.iter_timed(file_paths)
+
+        if self.shard is not None:
+            from check_copyright_shard import select_shard
+            file_paths = iter(select_shard(self, file_paths))
+
+        # Only pay for worker start-up when there are enough files to share out. A single
+        # job checks the files as they are discovered, e.g. as paths arrive on stdin.
+        first_files = list(itertools.islice(file_paths, PARALLEL_MIN_FILES)) if self.jobs > 1 else []
+        if self.jobs > 1 and not self.staged and len(first_files) == PARALLEL_MIN_FILES:
+            self.check_files_parallel(itertools.chain(first_files, file_paths))
+        else:
+            if self.staged:
+                self.blob_reader = GitBlobReader()
+            try:
+                for file_path in itertools.chain(first_files, file_paths):
+                    if not self.check_file(file_path):
+                        self.check_result = False
+            finally:
+                if self.blob_reader is not None:
+                    self.blob_reader.close()
+                    self.blob_reader = None
+
+        license_cache_stats = self.license_cache.get_stats()
+        print_debug(f"LICENSE cache: {license_cache_stats['hits']} hits, {license_cache_stats['probes']} filesystem probes, {license_cache_stats['reads']} LICENSE reads")
+        if self.result_cache is not None:
+            print_debug(f"Result cache: {self.result_cache.hits} unchanged files skipped")
+            self.result_cache.save()
+        if self.license_index is not None and self.license_index.changed:
+            self.license_index.save()
+
         if self.get_invalid_license_file_set():
             print_error("The following files need to be formatted according to the LICENSE file template:")
-            for file_path in self.invalid_license_file_set:
+            invalid_files = sorted(self.invalid_license_file_set)
+            for file_path in invalid_files:
                 print_info(f" - {file_path}")
-                if self.replace:
-                    self.replace_copyright(file_path)
+            if self.replace:
+                self.rewrite_files(invalid_files)
         if self.get_invalid_copyright_full_set():
             print_error("The following files need to be formatted according to the {ESPRESSIF_COPYRIGHT_FULL} template:")
-            for file_path in self.invalid_copyright_full_set:
+            invalid_files = sorted(self.invalid_copyright_full_set)
+            for file_path in invalid_files:
                 print_info(f" - {file_path}")
-                if self.replace:
-                    self.replace_copyright(file_path)
+            if self.replace:
+                self.rewrite_files(invalid_files)
         if self.get_invalid_copyright_short_set():
             print_error("The following files need to be formatted according to the {ESPRESSIF_COPYRIGHT_SHORT} template:")
-            for file_path in self.invalid_copyright_short_set:
+            invalid_files = sorted(self.invalid_copyright_short_set)
+            for file_path in invalid_files:
                 print_info(f" - {file_path}")
-                if self.replace:
-                    self.replace_copyright(file_path)
+            if self.replace:
+                self.rewrite_files(invalid_files)
 
 
-def main():
+    def is_watched_file(self, file_path):
+        """
+        Check whether changes of a file matter to --watch (source files and LICENSE files).
+        """
+        return os.path.basename(file_path) == LICENSE_FILE_NAME or os.path.splitext(file_path)[1].lower() in self.valid_extensions
+
+
+    def wait_for_changes(self, watcher):
+        """
+        Wait for a burst of changes and coalesce it.
+
+        The burst ends when no event arrived for WATCH_DEBOUNCE_SECONDS, or at the latest
+        WATCH_MAX_DELAY_SECONDS after it started, so editors saving repeatedly cause one check.
+
+        Returns:
+            set[str]: Changed paths.
+        """
+        changed = set()
+        while not changed:
+            changed = watcher.read_changes(None)
+        first_change = time.monotonic()
+        while time.monotonic() - first_change < WATCH_MAX_DELAY_SECONDS:
+            more_changes = watcher.read_changes(WATCH_DEBOUNCE_SECONDS)
+            if not more_changes:
+                break
+            changed |= more_changes
+        return changed
+
+
+    def get_watch_targets(self, changed):
+        """
+        Get the files to check again after some paths changed.
+
+        Args:
+            changed (set[str]): Changed files and new directories.
+
+        Returns:
+            list[str]: Existing source files, sorted.
+        """
+        file_paths = set()
+        for path in changed:
+            if os.path.basename(path) == LICENSE_FILE_NAME:
+                # A LICENSE file, even a removed one, decides the template of every file below it
+                file_paths.update(self.get_file_in_directory(os.path.dirname(path) or '.'))
+            elif os.path.isdir(path):
+                file_paths.update(self.get_file_in_directory(path))
+            elif os.path.isfile(path):
+                file_paths.add(path)
+        return sorted(file_paths)
+
+
+    def watch(self):
+        """
+        Check the input paths, then keep checking the files that change until interrupted.
+        """
+        roots = [path for path in self.new_file if os.path.isdir(path)]
+        files = [path for path in self.new_file if os.path.isfile(path)]
+        from check_copyright_watch import create_watcher
+        # Start watching before the first check, so nothing changed during it is missed
+        watcher = create_watcher(roots, files, self.rule_matcher.is_ignored_dir, self.is_watched_file)
+        try:
+            while True:
+                self.process()
+                if self.check_result:
+                    print_info("Good job! All files have the correct license format.")
+                if self.stats is not None:
+                    self.stats.print_summary()
+                print_info("Watching for changes, press Ctrl+C to stop.")
+
+                file_paths = []
+                while not file_paths:
+                    file_paths = self.get_watch_targets(self.wait_for_changes(watcher))
+                print_info(f"Checking {len(file_paths)} changed files.")
+                self.reset(file = file_paths, replace = self.replace, jobs = self.jobs, use_cache = self.use_cache, stats = self.stats is not None, git_years = self.git_years)
+        finally:
+            watcher.close()
+
+
+class _LogCapture(logging.Handler):
+    """
+    Collect the log messages of a worker process so the parent can replay them in order.
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+_worker_checker = None  # LicenseChecker of the current worker process
+_worker_log = None  # _LogCapture of the current worker process
+
+
+def _init_worker(config_path, replace, use_cache, stats, log_level, year_index, license_index, report):
+    """
+    Load the configuration once per worker process.
+    """
+    global _worker_checker, _worker_log
+    _worker_log = _LogCapture()
+    root_logger = logging.getLogger()
+    root_logger.handlers = [_worker_log]
+    root_logger.setLevel(log_level)
+    if report:
+        from check_copyright_report import ReportBuffer
+    _worker_checker = LicenseChecker(config_path=config_path, replace=replace, use_cache=use_cache, stats=stats, git_years=year_index is not None, report=ReportBuffer() if report else None)
+    _worker_checker.year_index = year_index
+    _worker_checker.license_index = _worker_checker.license_cache.index = license_index
+
+
+def _check_chunk(file_paths):
+    """
+    Check a chunk of files in a worker process.
+
+    Returns:
+        dict: Log messages, new invalid files and the check result of the chunk.
+    """
+    checker = _worker_checker
+    checker.check_result = True
+    checker.invalid_license_file_set = set()
+    checker.invalid_copyright_full_set = set()
+    checker.invalid_copyright_short_set = set()
+    checker.fix_plans = {}
+    _worker_log.records = []
+    license_cache_stats = checker.license_cache.get_stats()
+    result_cache = checker.result_cache
+    if result_cache is not None:
+        result_cache.updates = {}
+        result_cache.hits = 0
+    if checker.stats is not None:
+        checker.stats = RunStats()
+    if checker.report is not None:
+        checker.report.records = []
+
+    for file_path in file_paths:
+        if not checker.check_file(file_path):
+            checker.check_result = False
+
+    return {
+        'logs': _worker_log.records,
+        'invalid_license_files': checker.invalid_license_file_set,
+        'invalid_copyright_full': checker.invalid_copyright_full_set,
+        'invalid_copyright_short': checker.invalid_copyright_short_set,
+        'check_result': checker.check_result,
+        'license_cache_stats': {key: value - license_cache_stats[key] for key, value in checker.license_cache.get_stats().items()},
+        'result_cache_updates': result_cache.updates if result_cache is not None else {},
+        'result_cache_hits': result_cache.hits if result_cache is not None else 0,
+        'stats': checker.stats.to_dict() if checker.stats is not None else None,
+        'fix_plans': checker.fix_plans,
+        'report_records': checker.report.records if checker.report is not None else [],
+    }
+
+
+def run_watch(args):
+    """
+    Check the files selected on the command line, then check them again whenever they change.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        int: Exit code of the last check when interrupted, 0 if all files had the correct license format.
+    """
+    checker = LicenseChecker(config_path=args.config, file = args.file, replace=args.replace, jobs=args.jobs, use_cache=not args.no_cache, stats=args.stats or bool(args.stats_json), git_years=args.git_years)
+    try:
+        checker.watch()
+    except KeyboardInterrupt:
+        pass
+    return 0 if checker.check_result else 1
+
+
+def run_check(args, checker = None, output = None):
+    """
+    Check the files selected on the command line and report the result.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+        checker (LicenseChecker): Warm checker to reuse, a new one is created if None.
+        output (TextIO): Stream the --format report is written to, stdout if None.
+
+    Returns:
+        int: Exit code, 0 if all files have the correct license format.
+    """
+    options = dict(file = args.file, replace = args.replace, jobs = args.jobs, use_cache = not args.no_cache, staged = args.staged, stats = args.stats or bool(args.stats_json), git_years = args.git_years, shard = args.shard)
+    options['report'] = create_report(args.format, output or sys.stdout)
+    options['file_source'] = get_file_source(args)
+    if checker is None:
+        checker = LicenseChecker(config_path=args.config, **options)
+    else:
+        checker.reset(**options)
+
+    start_time = time.perf_counter()
+    try:
+        checker.process()
+    finally:
+        if checker.report is not None:
+            checker.report.close(checker.check_result)
+    elapsed = time.perf_counter() - start_time
+
+    if checker.check_result == False:
+        print_warning("The correct license format is as follows:")
+        checker.print_copyright()
+    else:
+        print_info("Good job! All files have the correct license format.")
+
+    if checker.stats is not None:
+        checker.stats.print_summary()
+        if args.stats_json:
+            with open(args.stats_json, 'w', encoding='utf-8') as file:
+                json.dump(checker.stats.to_dict(), file, indent=2)
+
+    if args.shard is not None:
+        from check_copyright_shard import get_partial_result_path, write_partial_result
+        write_partial_result(args.shard_output or get_partial_result_path(args.shard), checker, elapsed)
+
+    return 0 if checker.check_result else 1
+
+
+def get_file_source(args):
+    """
+    Get the stream of paths selected by --from-stdin, --tracked or --changed-since.
+
+    Returns:
+        Iterator[str] or None: Paths to filter and check, None to check the file arguments.
+    """
+    if args.from_stdin:
+        return map(as_walk_path, iter_delimited_paths(sys.stdin.buffer, b'\0' if args.null else b'\n'))
+    if args.tracked:
+        return iter_git_paths(['ls-files', '-z', '--'] + args.file)
+    if args.changed_since:
+        return iter_git_paths(['diff', '-z', '--name-only', '--relative', '--diff-filter=d', args.changed_since, '--'] + args.file)
+    return None
+
+
+def parse_shard(value):
+    """
+    Parse the INDEX/COUNT argument of --shard.
+
+    Returns:
+        tuple[int, int]: 1-based shard index and shard count.
+    """
+    try:
+        shard_index, shard_count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got '{value}'")
+    if not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError(f"the shard index must be between 1 and the shard count, got '{value}'")
+    return shard_index, shard_count
+
+
+def parse_arguments(argv):
+    """
+    Parse and validate the command line of a check, exiting with a usage message if it is invalid.
+
+    Args:
+        argv (list[str]): Command line arguments, without the program name.
+
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
     parser = argparse.ArgumentParser(description="Check the copyright declaration of newly added files.")
     parser.add_argument(
         '--config',
@@ -500,27 +2871,148 @@ def main():
         help="Increase the log verbosity, use -v, -vv, etc. to set"
     )
 
-    parser.add_argument('file', nargs = '+', help = "Input file list")
+    parser.add_argument(
+        '-j', '--jobs',
+        default = os.cpu_count() or 1,
+        type = int,
+        help = 'Number of worker processes used to check large file sets (default: CPU count)'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action = 'store_true',
+        help = 'Check every file again instead of skipping files unchanged since they last passed'
+    )
+
+    parser.add_argument(
+        '--staged',
+        action = 'store_true',
+        help = 'Check the staged content of the files added or modified in the Git index'
+    )
+
+    parser.add_argument(
+        '--from-stdin',
+        action = 'store_true',
+        help = 'Read the files to check from stdin, one per line, as they arrive'
+    )
+    parser.add_argument(
+        '-z', '--null',
+        action = 'store_true',
+        help = 'With --from-stdin, paths are separated by NUL characters (e.g. `git ls-files -z`, `find -print0`)'
+    )
+    parser.add_argument(
+        '--tracked',
+        action = 'store_true',
+        help = 'Check the files tracked by Git (`git ls-files`), limited to the given paths if any'
+    )
+    parser.add_argument(
+        '--changed-since',
+        metavar = 'REF',
+        type = str,
+        help = 'Check the files changed since a Git revision, including uncommitted changes, limited to the given paths if any'
+    )
+
+    parser.add_argument(
+        '--git-years',
+        action = 'store_true',
+        help = 'Expect the years of the Git history of each file (first commit to last change) instead of the current year'
+    )
+
+    parser.add_argument(
+        '--stats', '--profile',
+        action = 'store_true',
+        help = 'Print per-phase timings, I/O counters and the slowest files at the end'
+    )
+    parser.add_argument(
+        '--stats-json',
+        type = str,
+        help = 'Write the statistics as JSON to this file (implies --stats)'
+    )
+
+    parser.add_argument(
+        '--format',
+        default = 'text',
+        choices = REPORT_FORMATS,
+        help = 'Also write a record per checked file to stdout as soon as it is checked: JSON Lines or a SARIF log (default: text, log output only)'
+    )
+
+    parser.add_argument(
+        '--shard',
+        type = parse_shard,
+        metavar = 'INDEX/COUNT',
+        help = 'Check only shard INDEX (1-based) of COUNT of the files, balanced by file size, and write a partial result for `merge`'
+    )
+    parser.add_argument(
+        '--shard-output',
+        type = str,
+        help = 'Partial result file of --shard (default: check-copyright-shard-INDEX-of-COUNT.json)'
+    )
+
+    parser.add_argument(
+        '--watch',
+        action = 'store_true',
+        help = 'After checking, keep checking the files that change until interrupted'
+    )
+
+    parser.add_argument(
+        '--serve',
+        action = 'store_true',
+        help = 'Run a daemon that keeps the configuration and caches warm for later runs'
+    )
+    parser.add_argument(
+        '--no-daemon',
+        action = 'store_true',
+        help = 'Check the files in this process even if a daemon started with --serve is running (also CHECK_COPYRIGHT_DAEMON=0)'
+    )
+
+    parser.add_argument('file', nargs = '*', help = "Input file list")
+
+    args = parser.parse_args(argv)
+
+    if args.shard_output and args.shard is None:
+        parser.error("--shard-output needs --shard")
+    if sum(map(bool, (args.staged, args.from_stdin, args.tracked, args.changed_since))) > 1:
+        parser.error("only one of --staged, --from-stdin, --tracked and --changed-since can be used")
+    if args.null and not args.from_stdin:
+        parser.error("-z/--null needs --from-stdin")
+    if args.from_stdin and args.file:
+        parser.error("--from-stdin cannot be combined with file arguments")
+
+    if args.watch:
+        if args.shard is not None or args.format != 'text' or args.from_stdin or args.tracked or args.changed_since:
+            parser.error("--watch cannot be combined with --shard, --format, --from-stdin, --tracked or --changed-since")
+        if args.staged or not args.file:
+            parser.error("--watch needs files or directories to watch and cannot be combined with --staged")
+    return args
+
 
-    args = parser.parse_args()
+def main():
+    if sys.argv[1:2] == ['merge']:
+        from check_copyright_shard import merge_main
+        sys.exit(merge_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['index']:
+        from check_copyright_index import index_main
+        sys.exit(index_main(sys.argv[2:]))
+
+    args = parse_arguments(sys.argv[1:])
 
     logging.basicConfig(
         level = LOG_LEVELS[min(args.verbose, 2)],  # Limit the maximum log level to DEBUG
         format = '%(message)s'
     )
 
-    checker = LicenseChecker(config_path=args.config, file = args.file, replace=args.replace)
+    if args.watch:
+        sys.exit(run_watch(args))
 
-    checker.process()
-
-    if checker.check_result == False:
-        print_warning("The correct license format is as follows:")
-        checker.print_copyright()
-    else:
-        print_info("Good job! All files have the correct license format.")
+    if args.serve:
+        from check_copyright_server import CheckServer
+        from check_copyright_client import get_server_socket_path
+        sys.exit(CheckServer(get_server_socket_path()).serve_forever())
 
-    sys.exit(0 if checker.check_result else 1)
+    sys.exit(run_check(args))
 
 
 if __name__ == "__main__":
+    # The optional modules import this script by its module name, which must not load it a second time
+    sys.modules.setdefault('check_copyright', sys.modules[__name__])
     main()
@@ -0,0 +1,192 @@
+"""
+Client handing a check to a running `check-copyright --serve` daemon, small enough to run before the checker is loaded.
+"""
+import os
+import sys
+
+# socket and json are imported once a daemon socket exists, a check without a daemon only pays for a stat
+
+
+SERVER_SOCKET_NAME = 'check-copyright.sock'  # Unix socket of the --serve daemon inside $XDG_RUNTIME_DIR
+SERVER_CONNECT_TIMEOUT = 0.5  # Seconds the client waits to connect before checking files itself
+SERVER_ACCEPT_TIMEOUT = 5.0  # Seconds the client waits for the daemon to accept a request before checking files itself
+SERVER_IDLE_TIMEOUT = 60.0  # Seconds without any message after which the client gives up on the daemon
+SERVER_PROTOCOL_VERSION = 3  # Bump when the messages between the client and the daemon change
+SERVER_ENV_PREFIXES = ('GIT_', 'LANG', 'LC_')  # Environment variables of the client applied by the daemon to its request
+SERVER_DISABLE_VARIABLE = 'CHECK_COPYRIGHT_DAEMON'  # Set to 0 to always check files in this process, like --no-daemon
+LOCAL_COMMANDS = ('merge', 'index')  # Subcommands always run by the client
+LOCAL_ARGUMENTS = ('--no-daemon', '--serve', '--watch', '--from-stdin')  # Options the client does not even ask the daemon for
+CODE_MODULES = ('check_copyright', 'check_copyright_client', 'check_copyright_index', 'check_copyright_report',
+                'check_copyright_server', 'check_copyright_shard',
+                'check_copyright_watch')  # Modules a daemon and its clients must run the same version of
+
+
+def get_server_socket_path():
+    """
+    Get the path of the Unix socket the --serve daemon listens on.
+
+    Returns:
+        str: `check-copyright.sock` in $XDG_RUNTIME_DIR, or a per-user socket in /tmp.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, SERVER_SOCKET_NAME)
+    return os.path.join('/tmp', f"check-copyright-{os.getuid()}.sock")
+
+
+def get_peer_uid(connection):
+    """
+    Get the user id of the process at the other end of a Unix socket connection.
+
+    Returns:
+        int or None: User id, None where the platform does not provide `SO_PEERCRED`.
+    """
+    import socket
+    import struct
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    _, peer_uid, _ = struct.unpack('3i', connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    return peer_uid
+
+
+def get_code_version():
+    """
+    Identify the protocol and the code of check-copyright, so that a daemon only serves clients running the same code.
+
+    Returns:
+        list: Protocol version, then the size and modification time of every module in `CODE_MODULES`.
+    """
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    code_version = [SERVER_PROTOCOL_VERSION]
+    for module_name in CODE_MODULES:
+        code_stat = os.stat(os.path.join(code_dir, f"{module_name}.py"))
+        code_version += [code_stat.st_size, code_stat.st_mtime_ns]
+    return code_version
+
+
+def get_file_id(file_path):
+    """
+    Identify a file or directory by its status, for the client and the daemon to check they see the same one.
+    """
+    file_stat = os.stat(file_path)
+    return [file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def write_log(message):
+    """
+    Write a log message to stderr, formatted like the log output of a check run in this process.
+    """
+    sys.stderr.write(message + '\n')
+    sys.stderr.flush()
+
+
+def request_server(socket_path, argv):
+    """
+    Let a running daemon check the files, printing its log messages and report as they arrive.
+
+    The daemon is only used when it runs as the current user (checked with `SO_PEERCRED`,
+    or trusted from the private $XDG_RUNTIME_DIR where the platform cannot tell), runs the
+    same version of the script, sees the same working directory and configuration file,
+    and accepts the request within `SERVER_ACCEPT_TIMEOUT`. The daemon parses the command
+    line itself and declines the modes it cannot run, such as `--from-stdin`.
+
+    Args:
+        socket_path (str): Path of the daemon's Unix socket.
+        argv (list[str]): Command line arguments, without the program name.
+
+    Returns:
+        int or None: Exit code of the check, None if the files must be checked in this process.
+    """
+    if not os.path.exists(socket_path):
+        return None
+    import json
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(SERVER_CONNECT_TIMEOUT)
+        client.connect(socket_path)
+        peer_uid = get_peer_uid(client)
+    except OSError:
+        client.close()
+        return None
+    if peer_uid != os.getuid() and (peer_uid is not None or os.path.dirname(socket_path) != os.environ.get('XDG_RUNTIME_DIR')):
+        write_log(f"\033[33mNot using the daemon on {socket_path}, it does not run as the current user.\033[0m")
+        client.close()
+        return None
+
+    try:
+        request = {
+            'version': get_code_version(),
+            'cwd': os.getcwd(),
+            'cwd_id': get_file_id(os.curdir),
+            'env': {name: value for name, value in os.environ.items() if name.startswith(SERVER_ENV_PREFIXES)},
+            'argv': argv,
+        }
+    except OSError:
+        client.close()
+        return None
+
+    with client, client.makefile('rb') as reader:
+        try:
+            client.settimeout(SERVER_ACCEPT_TIMEOUT)
+            client.sendall(json.dumps(request).encode() + b'\n')
+            response = json.loads(reader.readline() or b'{}')
+            # The daemon names the configuration file it would load, the client checks it sees the same one
+            if 'config' in response:
+                try:
+                    config_id = get_file_id(response['config'])
+                except OSError:
+                    return None  # The check reports the missing configuration file
+                client.sendall(json.dumps({'config_id': config_id}).encode() + b'\n')
+                response = json.loads(reader.readline() or b'{}')
+        except (OSError, ValueError):
+            response = {}
+        if 'declined' in response:
+            return None
+        if 'accepted' not in response:
+            write_log(f"\033[33mNot using the daemon on {socket_path}, {response.get('refused', 'it did not accept the request')}.\033[0m")
+            return None
+
+        try:
+            client.settimeout(SERVER_IDLE_TIMEOUT)
+            for line in reader:
+                response = json.loads(line)
+                if 'exit' in response:
+                    return response['exit']
+                if 'output' in response:
+                    sys.stdout.write(response['output'])
+                    sys.stdout.flush()
+                elif 'message' in response:
+                    write_log(response['message'])
+        except socket.timeout:
+            write_log(f"\033[31mThe check-copyright daemon did not respond for {SERVER_IDLE_TIMEOUT:.0f} seconds.\033[0m")
+            return 1
+
+    write_log("\033[31mThe check-copyright daemon closed the connection before finishing.\033[0m")
+    return 1
+
+
+def exit_if_served(argv):
+    """
+    Exit with the result of the check if a running daemon performed it, otherwise return to check the files here.
+
+    Args:
+        argv (list[str]): Command line arguments, without the program name.
+    """
+    if argv[:1] and argv[0] in LOCAL_COMMANDS or any(argument in LOCAL_ARGUMENTS for argument in argv):
+        return
+    if os.environ.get(SERVER_DISABLE_VARIABLE) == '0':
+        return
+    exit_code = request_server(get_server_socket_path(), argv)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def main():
+    """
+    Entry point of `check-copyright`: a running daemon checks the files, otherwise the checker is loaded to check them here.
+    """
+    exit_if_served(sys.argv[1:])
+    import check_copyright
+    check_copyright.main()
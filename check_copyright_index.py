@@ -0,0 +1,478 @@
+"""
+Persistent license index of a Git repository, built and shown by `check-copyright index`
+and used by the checks once it exists.
+"""
+import os
+import json
+import logging
+import argparse
+import stat
+import subprocess
+import hashlib
+
+from check_copyright import (
+    LICENSE_FILE_NAME,
+    LICENSE_INDEX_VERSION,
+    LOG_LEVELS,
+    find_git_dir,
+    find_work_tree,
+    LicenseChecker,
+    print_debug,
+    print_error,
+    print_info,
+    print_warning,
+    write_file_atomic,
+)
+
+
+GIT_TREE_READ_SIZE = 65536  # Bytes of `git ls-tree` output parsed at a time
+
+
+class LicenseIndex:
+    """
+    Persistent map of the directories of the HEAD tree to their LICENSE file and the jobs of their files.
+
+    The index is built from one streaming `git ls-tree -r -t` pass and records, for every
+    directory, its tree hash, whether it is ignored and the job matched by each checked
+    file, so that matching a file or pruning a directory is a dictionary lookup. When HEAD
+    moves, only the directories whose tree hash changed are read again. Whether a directory has a LICENSE file, and the verdicts of
+    that LICENSE file, are taken from the working tree and kept with the modification time
+    of the directory and the size and modification time of the LICENSE file, so a LICENSE
+    file added, removed or edited without a commit is noticed by one `stat` per directory.
+    The upward LICENSE search itself still runs on every lookup, on the indexed facts,
+    because its result depends on the form of the path.
+    """
+    def __init__(self, top_level, fingerprint):
+        """
+        Args:
+            top_level (str): Root of the working tree.
+            fingerprint (str): Fingerprint of everything the jobs depend on (configuration content, index version).
+        """
+        self.top_level = top_level
+        self.fingerprint = fingerprint
+        self.cache_path = None  # Path the index is stored at, set by refresh
+        self.loaded = False  # Whether the stored index was read
+        self.changed = False  # Whether the index differs from the stored one
+        self.head = None  # Commit the index was built at, None without commits
+        self.tree = None  # Tree of that commit
+        self.jobs = []  # Matching job names (None for ignored files), referenced by position from the file entries
+        self.job_ids = {}  # Matching job names -> position in jobs
+        self.dirs = {}  # path relative to the top level ('' for the top level) -> [tree hash, directory mtime_ns, [LICENSE size, mtime_ns] or None, {name: job}, {name: job of the path without `./`}, ignored flags]
+        self.verdicts = {}  # directory with a LICENSE file -> {verdict key: verdict}
+        self.verdict_keys = {}  # (expected license, expected text) -> verdict key
+        self.dir_keys = {}  # directory as given -> path relative to the top level, None if not indexed
+        self.checked_dirs = set()  # Directories compared with the working tree in this run
+        self.checked_licenses = set()  # LICENSE files compared with the working tree in this run
+        self.cwd_key = None  # Current directory relative to the top level, None outside the working tree
+        self.probes = 0
+
+
+    def run_git(self, *args, check = True):
+        return subprocess.run(['git'] + list(args), cwd=self.top_level, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=check).stdout
+
+
+    def refresh(self, cache_path, rule_matcher, valid_extensions, rebuild = False):
+        """
+        Load the stored index and bring it up to date with HEAD.
+
+        Args:
+            cache_path (str): Path to the stored index.
+            rule_matcher (RuleMatcher): Rules deciding the job of each file.
+            valid_extensions (set[str]): Extensions of the checked files.
+            rebuild (bool): Read the whole tree and every LICENSE file again instead of reusing what is unchanged.
+
+        Raises:
+            subprocess.CalledProcessError: The Git tree could not be read.
+        """
+        self.cache_path = cache_path
+        if rebuild:
+            self.head, self.tree, self.jobs, self.job_ids, self.dirs, self.verdicts = None, None, [], {}, {}, {}
+            self.changed = True
+        elif not self.loaded:
+            self.load()
+        self.loaded = True
+
+        head = self.run_git('rev-parse', '--verify', '--quiet', 'HEAD', check=False).strip().decode() or None
+        if rebuild or head != self.head:
+            tree = self.run_git('rev-parse', f'{head}^{{tree}}').strip().decode() if head is not None else None
+            if tree != self.tree:
+                print_debug(f"Reading the directories changed since the license index was built at {self.tree[:12]}." if self.tree is not None else "Reading the Git tree into the license index.")
+                self.read_tree(head, tree, rule_matcher, valid_extensions)
+            self.head, self.tree = head, tree
+            self.changed = True
+
+        self.dir_keys = {}
+        self.checked_dirs = set()
+        self.checked_licenses = set()
+        self.probes = 0
+        cwd_key = os.path.relpath(os.path.abspath(os.curdir), self.top_level).replace(os.sep, '/')
+        self.cwd_key = None if cwd_key == os.pardir or cwd_key.startswith('../') else '' if cwd_key == os.curdir else cwd_key
+        if self.changed:
+            self.save()
+
+
+    def load(self):
+        """
+        Read the stored index, ignoring it if it is missing, corrupted or stale.
+        """
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') != LICENSE_INDEX_VERSION or data.get('fingerprint') != self.fingerprint:
+                print_debug(f"License index {self.cache_path} is stale, rebuilding it.")
+                return
+            self.head, self.tree, self.dirs, self.verdicts = data['head'], data['tree'], data['dirs'], data['verdicts']
+            self.jobs = [tuple(job) if job is not None else None for job in data['jobs']]
+        except (OSError, ValueError, KeyError):
+            return
+        self.job_ids = {job: job_id for job_id, job in enumerate(self.jobs)}
+
+
+    def read_tree(self, head, tree, rule_matcher, valid_extensions):
+        """
+        Index the directories of a commit, keeping the entries of the directories whose tree is unchanged.
+
+        Args:
+            head (str): Commit to read, None for an empty index.
+            tree (str): Tree of the commit.
+            rule_matcher (RuleMatcher): Rules deciding the job of each file.
+            valid_extensions (set[str]): Extensions of the checked files.
+        """
+
+        old_dirs = self.dirs
+        self.dirs = {}
+        if head is not None:
+            # A directory whose tree changed is probed again on use (no directory mtime), the checkout
+            # may have replaced its LICENSE file without changing the modification time of the directory
+            self.dirs[''] = [tree, None, None, {}, {}, self.get_ignored_flags(rule_matcher, os.curdir, os.curdir)]
+
+            # Every entry is "<mode> <type> <hash>\t<path>\0", a directory is listed before its content
+            process = subprocess.Popen(
+                ['git', 'ls-tree', '-r', '-t', '-z', '--full-tree', head],
+                cwd=self.top_level, stdout=subprocess.PIPE
+            )
+            reused = set()
+            pending = b''
+            for chunk in iter(lambda: process.stdout.read(GIT_TREE_READ_SIZE), b''):
+                fields = (pending + chunk).split(b'\0')
+                pending = fields.pop()
+                for field in fields:
+                    info, _, path = field.partition(b'\t')
+                    _, object_type, object_hash = info.split(b' ')
+                    path = os.fsdecode(path)
+                    if object_type == b'tree':
+                        object_hash = object_hash.decode()
+                        entry = old_dirs.get(path)
+                        if entry is not None and entry[0] == object_hash:
+                            reused.add(path)
+                        else:
+                            entry = [object_hash, None, None, {}, {}, self.get_ignored_flags(rule_matcher, f'./{path}', path)]
+                        self.dirs[path] = entry
+                        continue
+
+                    directory, _, name = path.rpartition('/')
+                    if object_type != b'blob' or directory in reused or os.path.splitext(name)[1].lower() not in valid_extensions:
+                        continue
+                    entry = self.dirs[directory]
+                    # Walks of `.` and --tracked give paths starting with `./`, pre-commit gives them without
+                    job = rule_matcher.match_rules(f'./{path}')
+                    entry[3][name] = self.get_job_id(job)
+                    bare_job = rule_matcher.match_rules(path)
+                    if bare_job != job:
+                        entry[4][name] = self.get_job_id(bare_job)
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, 'git ls-tree')
+
+        self.verdicts = {dir_key: verdicts for dir_key, verdicts in self.verdicts.items() if dir_key in self.dirs}
+
+
+    def get_ignored_flags(self, rule_matcher, directory, bare_directory):
+        """
+        Get whether a directory is ignored, as a walk of `.` (bit 1) and as a path without `./` (bit 2) give it.
+        """
+        return rule_matcher.is_ignored_dir(directory) | rule_matcher.is_ignored_dir(bare_directory) << 1
+
+
+    def get_job_id(self, job):
+        """
+        Get the position of matching job names (None for ignored files) in `jobs`.
+        """
+        job_id = self.job_ids.get(job)
+        if job_id is None:
+            job_id = self.job_ids[job] = len(self.jobs)
+            self.jobs.append(job)
+        return job_id
+
+
+    def save(self):
+        """
+        Write the index atomically.
+        """
+        data = {
+            'version': LICENSE_INDEX_VERSION,
+            'fingerprint': self.fingerprint,
+            'head': self.head,
+            'tree': self.tree,
+            'jobs': self.jobs,
+            'dirs': self.dirs,
+            'verdicts': self.verdicts,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            write_file_atomic(self.cache_path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            self.changed = False
+        except OSError as e:
+            print_warning(f"Could not write license index {self.cache_path}: {e}")
+
+
+    def get_dir_key(self, directory):
+        """
+        Get the indexed path of a directory.
+
+        Args:
+            directory (str): Directory path, relative to the current directory or absolute.
+
+        Returns:
+            str or None: Path relative to the top level ('' for the top level), None if the directory is not indexed.
+        """
+        dir_key = self.dir_keys.get(directory, False)
+        if dir_key is not False:
+            return dir_key
+
+        dir_key = None
+        # Paths such as `./src/main` only need the current directory in front, indexed paths have no `.` or `..` parts
+        if self.cwd_key is not None and not os.path.isabs(directory):
+            path = directory[2:] if directory.startswith('./') else directory
+            path = self.cwd_key if path in ('', os.curdir) else f'{self.cwd_key}/{path}' if self.cwd_key else path
+            if path in self.dirs:
+                dir_key = path
+        if dir_key is None:
+            path = os.path.relpath(os.path.abspath(directory), self.top_level).replace(os.sep, '/')
+            path = '' if path == os.curdir else path
+            if path in self.dirs:
+                dir_key = path
+        self.dir_keys[directory] = dir_key
+        return dir_key
+
+
+    def get_license_stat(self, directory):
+        """
+        Get the size and modification time of the LICENSE file of a directory, None if it has none.
+        """
+        self.probes += 1
+        try:
+            license_stat = os.stat(os.path.join(directory, LICENSE_FILE_NAME))
+        except OSError:
+            return None
+        return [license_stat.st_size, license_stat.st_mtime_ns] if stat.S_ISREG(license_stat.st_mode) else None
+
+
+    def get_dir_entry(self, directory):
+        """
+        Get the entry of a directory, updating its LICENSE file if the directory changed in the working tree.
+
+        Args:
+            directory (str): Directory path, relative to the current directory or absolute.
+
+        Returns:
+            list or None: Entry of the directory, None if it is not indexed.
+        """
+        dir_key = self.get_dir_key(directory)
+        if dir_key is None:
+            return None
+        entry = self.dirs[dir_key]
+        if dir_key not in self.checked_dirs:
+            self.checked_dirs.add(dir_key)
+            self.probes += 1
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self.dir_keys[directory] = None
+                return None
+            # Adding, removing or renaming a file changes the modification time of its directory
+            if dir_mtime != entry[1]:
+                self.probes += 1
+                if os.path.isdir(os.path.join(directory, '.git')):
+                    # A repository cloned inside the working tree, the LICENSE search stops here
+                    self.dir_keys[directory] = None
+                    return None
+                entry[1] = dir_mtime
+                entry[2] = self.get_license_stat(directory)
+                self.checked_licenses.add(dir_key)
+                self.verdicts.pop(dir_key, None)
+                self.changed = True
+        return entry
+
+
+    def has_license_file(self, directory):
+        """
+        Check whether a directory contains a LICENSE file.
+
+        Returns:
+            bool or None: Whether the directory has a LICENSE file, None if the index cannot tell.
+        """
+        entry = self.get_dir_entry(directory)
+        return entry[2] is not None if entry is not None else None
+
+
+    def get_rule_key(self, file_path):
+        """
+        Get the matching job names of a file.
+
+        Args:
+            file_path (str): File path relative to the current directory.
+
+        Returns:
+            tuple[str] or None: Matching job names as returned by `RuleMatcher.match_rules`, None if the file is ignored.
+
+        Raises:
+            KeyError: The file is not indexed.
+        """
+        # Job globs see the path as given, so only paths relative to the top level are looked up
+        if self.cwd_key != '' or os.path.isabs(file_path):
+            raise KeyError(file_path)
+        bare = not file_path.startswith('./')
+        directory, _, name = (file_path if bare else file_path[2:]).rpartition('/')
+        entry = self.dirs[directory]
+        job_id = entry[4].get(name) if bare else None
+        return self.jobs[entry[3][name] if job_id is None else job_id]
+
+
+    def is_ignored_dir(self, directory):
+        """
+        Check whether every file below a directory is ignored.
+
+        Args:
+            directory (str): Directory path relative to the current directory.
+
+        Returns:
+            bool: Whether the directory can be skipped, as returned by `RuleMatcher.is_ignored_dir`.
+
+        Raises:
+            KeyError: The directory is not indexed.
+        """
+        if self.cwd_key != '' or os.path.isabs(directory):
+            raise KeyError(directory)
+        if directory.startswith('./'):
+            return bool(self.dirs[directory[2:]][5] & 1)
+        return bool(self.dirs['' if directory == os.curdir else directory][5] & (1 if directory == os.curdir else 2))
+
+
+    def get_verdict_key(self, expect_license, expect_text):
+        """
+        Get the short key a LICENSE verdict is stored under for an expected license and text.
+        """
+        verdict_key = self.verdict_keys.get((expect_license, expect_text))
+        if verdict_key is None:
+            verdict_key = hashlib.sha256(f"{expect_license}\0{expect_text}".encode('utf-8')).hexdigest()[:16]
+            self.verdict_keys[(expect_license, expect_text)] = verdict_key
+        return verdict_key
+
+
+    def get_license_key(self, license_path):
+        """
+        Get the indexed directory of a LICENSE file, checking that the file is unchanged since its verdicts were stored.
+
+        Returns:
+            str or None: Directory relative to the top level, None if it is not indexed.
+        """
+        directory = os.path.dirname(license_path)
+        entry = self.get_dir_entry(directory)
+        if entry is None or entry[2] is None:
+            return None
+        dir_key = self.get_dir_key(directory)
+        if dir_key not in self.checked_licenses:
+            self.checked_licenses.add(dir_key)
+            license_stat = self.get_license_stat(directory)
+            if license_stat != entry[2]:
+                entry[2] = license_stat
+                self.verdicts.pop(dir_key, None)
+                self.changed = True
+        return dir_key if entry[2] is not None else None
+
+
+    def get_verdict(self, license_path, expect_license, expect_text):
+        """
+        Get the stored verdict of a LICENSE file.
+
+        Returns:
+            str or None: The verdict, None if it is not known.
+        """
+        dir_key = self.get_license_key(license_path)
+        if dir_key is None:
+            return None
+        return self.verdicts.get(dir_key, {}).get(self.get_verdict_key(expect_license, expect_text))
+
+
+    def set_verdict(self, license_path, expect_license, expect_text, verdict):
+        """
+        Store the verdict of a LICENSE file.
+        """
+        dir_key = self.get_license_key(license_path)
+        if dir_key is not None:
+            self.verdicts.setdefault(dir_key, {})[self.get_verdict_key(expect_license, expect_text)] = verdict
+            self.changed = True
+
+
+def index_main(argv):
+    """
+    Entry point of `check-copyright index`.
+
+    Args:
+        argv (List[str]): Arguments following the subcommand.
+
+    Returns:
+        int: Exit code.
+    """
+    parser = argparse.ArgumentParser(prog = 'check-copyright index', description="Build or update the license index of the repository, used by later checks.")
+    parser.add_argument(
+        '--config',
+        default = 'check_copyright_config.yaml',
+        type = str,
+        help = 'Configuration file path'
+    )
+    parser.add_argument(
+        '--rebuild',
+        action = 'store_true',
+        help = 'Read the whole Git tree again instead of only the directories changed since the index was built'
+    )
+    parser.add_argument(
+        '--show',
+        action = 'store_true',
+        help = 'Print the job, governing LICENSE file, LICENSE verdict and template of every indexed directory'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action = 'count',
+        default = 1,
+        help="Increase the log verbosity, use -v, -vv, etc. to set"
+    )
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level = LOG_LEVELS[min(args.verbose, 2)],  # Limit the maximum log level to DEBUG
+        format = '%(message)s'
+    )
+
+    checker = LicenseChecker(config_path=args.config)
+    git_dir = find_git_dir()
+    if git_dir is None:
+        print_error("The license index needs a Git repository.")
+        return 1
+    # Index paths are relative to the top level, like the paths of a walk of `.` there
+    os.chdir(find_work_tree())
+    license_index = checker.open_license_index(rebuild = args.rebuild, create = True)
+    if license_index is None:
+        return 1
+
+    # Resolving every directory also stores the verdict of every LICENSE file for each job
+    license_map = list(checker.iter_license_map(license_index))
+    if license_index.changed:
+        license_index.save()
+
+    if args.show:
+        for directory, job_name, license_path, verdict, template in license_map:
+            print_info(f"{directory}: job {job_name}, LICENSE {license_path or '-'} ({verdict or 'none'}), {template} template")
+    print_info(f"License index of {license_index.tree[:12] if license_index.tree else 'an empty tree'}: {len(license_index.dirs)} directories, {sum(entry[2] is not None for entry in license_index.dirs.values())} LICENSE files")
+    return 0
@@ -0,0 +1,125 @@
+"""
+Report writers of `check-copyright --format jsonl` and `--format sarif`.
+"""
+import os
+import json
+import time
+
+from check_copyright import FILE_ERROR, FILE_FAILED
+
+
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+SARIF_RULES = {  # SARIF rule id -> description
+    'license-file': 'The LICENSE file does not match the LICENSE file template',
+    'copyright-full': 'The copyright declaration does not match the FULL template',
+    'copyright-short': 'The copyright declaration does not match the SHORT template',
+    'check-error': 'The file could not be checked',
+}
+
+
+class JsonLinesReport:
+    """
+    Report writer of --format jsonl: one JSON object per line, written as soon as a file is checked.
+
+    Every checked file gets a `file` record, every LICENSE file with an incorrect format
+    a `license` record, and a `summary` record closes the report.
+    """
+    def __init__(self, stream):
+        """
+        Args:
+            stream (TextIO): Stream the records are written to.
+        """
+        self.stream = stream
+        self.files = 0
+        self.failed = 0
+        self.start_time = time.perf_counter()
+
+
+    def write(self, record):
+        """
+        Write a `file` or `license` record.
+        """
+        if record['type'] == 'file':
+            self.files += 1
+        if record['result'] in (FILE_FAILED, FILE_ERROR):
+            self.failed += 1
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+    def close(self, check_result):
+        """
+        Write the `summary` record.
+
+        Args:
+            check_result (bool): Whether all files have the correct license format.
+        """
+        summary = {'type': 'summary', 'check_result': check_result, 'files': self.files, 'failed': self.failed, 'seconds': round(time.perf_counter() - self.start_time, 6)}
+        self.stream.write(json.dumps(summary) + '\n')
+        self.stream.flush()
+
+
+class SarifReport:
+    """
+    Report writer of --format sarif: a SARIF 2.1.0 log whose results are written as files fail.
+
+    Only failures become results, so passing files cost nothing but their count.
+    """
+    def __init__(self, stream):
+        """
+        Args:
+            stream (TextIO): Stream the log is written to.
+        """
+        self.stream = stream
+        self.results = 0
+        rules = [{'id': rule_id, 'shortDescription': {'text': description}} for rule_id, description in SARIF_RULES.items()]
+        driver = {'name': 'check-copyright', 'informationUri': 'https://github.com/ALToast/check-copyright', 'rules': rules}
+        header = json.dumps({'version': '2.1.0', '$schema': SARIF_SCHEMA, 'runs': [{'tool': {'driver': driver}, 'results': []}]})
+        # Leave the results array open, results are appended as they arrive
+        self.stream.write(header[:-len(']}]}')])
+        self.stream.flush()
+
+
+    def write(self, record):
+        """
+        Write a `file` or `license` record as a SARIF result if it is a failure.
+        """
+        if record['result'] == FILE_ERROR:
+            rule_id = 'check-error'
+        elif record['result'] != FILE_FAILED:
+            return
+        elif record['type'] == 'license':
+            rule_id = 'license-file'
+        else:
+            rule_id = f"copyright-{record['template']}"
+
+        result = {
+            'ruleId': rule_id,
+            'level': 'error',
+            'message': {'text': record['reason'] or SARIF_RULES[rule_id]},
+            'locations': [{'physicalLocation': {'artifactLocation': {'uri': record['path'].replace(os.sep, '/')}, 'region': {'startLine': 1}}}],
+            'properties': {key: record[key] for key in ('job', 'license', 'seconds') if record.get(key) is not None},
+        }
+        self.stream.write((',' if self.results else '') + '\n' + json.dumps(result))
+        self.stream.flush()
+        self.results += 1
+
+
+    def close(self, check_result):
+        """
+        Close the results array and the log.
+        """
+        self.stream.write('\n]}]}\n')
+        self.stream.flush()
+
+
+class ReportBuffer:
+    """
+    Collect the report records of a worker process, to be written by the main process.
+    """
+    def __init__(self):
+        self.records = []
+
+
+    def write(self, record):
+        self.records.append(record)
@@ -0,0 +1,274 @@
+"""
+Daemon of `check-copyright --serve`, checking files for the clients of `check_copyright_client`.
+"""
+import os
+import sys
+import io
+import json
+import logging
+import threading
+import contextlib
+import socket
+import signal
+
+from datetime import datetime
+
+from check_copyright import (LOG_LEVELS, LicenseChecker, parse_arguments, print_debug, print_error, print_info,
+                             print_warning, run_check)
+from check_copyright_client import LOCAL_COMMANDS, SERVER_ENV_PREFIXES, get_code_version, get_file_id, get_peer_uid
+
+
+SERVER_HEARTBEAT_SECONDS = 10.0  # Seconds between the messages the daemon sends while a check runs
+
+
+class _ClientStream:
+    """
+    Messages sent by the daemon to a client, one JSON object per line.
+
+    The check and the heartbeat thread send messages concurrently, so every message is sent under a lock.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+
+    def send(self, message):
+        with self.lock:
+            try:
+                self.connection.sendall(json.dumps(message).encode() + b'\n')
+            except OSError:
+                pass  # The client went away, finish the request anyway
+
+
+class _SocketLogHandler(logging.Handler):
+    """
+    Stream the log messages of a request handled by the daemon to its client.
+    """
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+
+    def emit(self, record):
+        self.stream.send({'level': record.levelno, 'message': record.getMessage()})
+
+
+class _SocketOutput:
+    """
+    Stream the --format report of a request handled by the daemon to its client's stdout.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+
+    def write(self, text):
+        self.stream.send({'output': text})
+
+
+    def flush(self):
+        pass
+
+
+class CheckServer:
+    """
+    Daemon that checks files on behalf of thin clients connecting to a Unix socket.
+
+    The parsed configuration, compiled rules and result caches of every configuration
+    file are kept warm between requests. A configuration file is loaded again when it
+    changes on disk, and requests are handled one at a time, in the client's working
+    directory and with the client's Git and locale environment variables.
+
+    A request is refused when the client runs another version of the script, or when the
+    daemon does not see the same working directory and configuration file (e.g. from
+    another mount namespace); the client then checks the files itself.
+    """
+    def __init__(self, socket_path):
+        """
+        Args:
+            socket_path (str): Path of the Unix socket to listen on.
+        """
+        self.socket_path = socket_path
+        self.code_version = get_code_version()  # Of the code loaded at startup, the script may be upgraded while serving
+        self.checkers = {}  # absolute config path -> (config file status, year, LicenseChecker)
+
+
+    def get_checker(self, config_path):
+        """
+        Get the warm checker of a configuration file, loading it again if the file changed.
+
+        Args:
+            config_path (str): Absolute path to the configuration file.
+
+        Returns:
+            LicenseChecker: The checker.
+        """
+        config_stat = os.stat(config_path)
+        config_key = (config_stat.st_ino, config_stat.st_size, config_stat.st_mtime_ns)
+        year = datetime.now().year
+        cached = self.checkers.get(config_path)
+        if cached is not None and cached[0] == config_key and cached[1] == year:
+            return cached[2]
+
+        if cached is not None:
+            print_debug(f"Configuration {config_path} changed, reloading it.")
+        checker = LicenseChecker(config_path=config_path)
+        self.checkers[config_path] = (config_key, year, checker)
+        return checker
+
+
+    def parse_request(self, request):
+        """
+        Parse the command line of a request like the client would.
+
+        Returns:
+            argparse.Namespace or None: Parsed arguments, None if the daemon does not run this
+            command line (invalid arguments, or a mode that needs the client's terminal or stdin).
+        """
+        argv = request['argv']
+        if argv[:1] and argv[0] in LOCAL_COMMANDS:
+            return None
+        try:
+            # Usage errors and --help are left to the client, which prints them when it checks the files itself
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                args = parse_arguments(argv)
+        except SystemExit:
+            return None
+        if args.serve or args.watch or args.from_stdin or args.no_daemon:
+            return None
+        return args
+
+
+    def get_refusal(self, request):
+        """
+        Check that the daemon runs the client's version of the script, in the same working directory.
+
+        Returns:
+            str or None: Why the request is refused, None if it is accepted.
+        """
+        if request.get('version') != self.code_version:
+            return "it runs another version of check-copyright, restart it"
+        try:
+            same_dir = get_file_id(request['cwd'])[:2] == request['cwd_id'][:2]
+        except OSError:
+            same_dir = False
+        if not same_dir:
+            return "it does not see the same working directory"
+        return None
+
+
+    def handle(self, connection):
+        """
+        Run the check requested by a client and stream the log messages, report and exit code back.
+
+        The daemon names the configuration file it resolved from the request, and the client
+        confirms it sees the same file before the check starts. A heartbeat message is sent
+        every `SERVER_HEARTBEAT_SECONDS` while the check runs, so that the client can tell a
+        long check without output from a daemon that hangs.
+        """
+        if get_peer_uid(connection) not in (None, os.getuid()):
+            return
+
+        reader = connection.makefile('rb')
+        stream = _ClientStream(connection)
+        with reader:
+            request = json.loads(reader.readline())
+            refusal = self.get_refusal(request)
+            if refusal is not None:
+                stream.send({'refused': refusal})
+                return
+            args = self.parse_request(request)
+            if args is None:
+                stream.send({'declined': True})
+                return
+            args.config = os.path.join(request['cwd'], args.config)
+            stream.send({'config': args.config})
+            config_reply = reader.readline()
+            if not config_reply:
+                return  # The client cannot read the configuration file and checks the files itself
+            config_reply = json.loads(config_reply)
+        try:
+            same_config = get_file_id(args.config) == config_reply['config_id']
+        except OSError:
+            same_config = False
+        if not same_config:
+            stream.send({'refused': "it does not see the same configuration file"})
+            return
+        stream.send({'accepted': True})
+
+        stop_heartbeat = threading.Event()
+        def send_heartbeats():
+            while not stop_heartbeat.wait(SERVER_HEARTBEAT_SECONDS):
+                stream.send({'alive': True})
+        heartbeat_thread = threading.Thread(target=send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+
+        root_logger = logging.getLogger()
+        saved_handlers, saved_level = root_logger.handlers, root_logger.level
+        root_logger.handlers = [_SocketLogHandler(stream)]
+        root_logger.setLevel(LOG_LEVELS[min(args.verbose, 2)])
+        server_dir = os.getcwd()
+        # Git and its subprocesses see the client's variables (e.g. GIT_INDEX_FILE in a hook), not the daemon's
+        saved_environ = dict(os.environ)
+        for name in [name for name in os.environ if name.startswith(SERVER_ENV_PREFIXES)]:
+            del os.environ[name]
+        os.environ.update(request['env'])
+        try:
+            os.chdir(request['cwd'])
+            exit_code = run_check(args, self.get_checker(args.config), _SocketOutput(stream))
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 0
+        except Exception as e:
+            print_error(f"Error occurred while checking files: {e}")
+            exit_code = 1
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_environ)
+            os.chdir(server_dir)
+            root_logger.handlers = saved_handlers
+            root_logger.setLevel(saved_level)
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+        stream.send({'exit': exit_code})
+
+
+    def serve_forever(self):
+        """
+        Listen on the socket until interrupted.
+
+        Returns:
+            int: Exit code, 1 if another daemon is already listening.
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+                print_error(f"A check-copyright daemon is already listening on {self.socket_path}.")
+                return 1
+            except OSError:
+                os.unlink(self.socket_path)  # Left behind by a daemon that was killed
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # Only the current user may connect
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print_info(f"Serving on {self.socket_path}")
+
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        self.handle(connection)
+                    except (OSError, ValueError, KeyError) as e:
+                        print_warning(f"Dropped a malformed request: {e}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+        return 0
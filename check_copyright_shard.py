@@ -0,0 +1,216 @@
+"""
+Shard selection of `check-copyright --shard` and the partial results merged by `check-copyright merge`.
+"""
+import os
+import json
+import logging
+import argparse
+import heapq
+import zlib
+
+from check_copyright import (
+    DEFAULT_HEADER_WINDOW_BYTES,
+    ESPRESSIF_COPYRIGHT_FULL,
+    ESPRESSIF_COPYRIGHT_SHORT,
+    HEADER_WINDOW_BYTES,
+    LOG_LEVELS,
+    print_debug,
+    print_error,
+    print_info,
+    print_warning,
+)
+
+
+SHARD_FILE_COST_BYTES = 4096  # Fixed cost of a file (open, stat, rule matching) added to its size when balancing shards
+PARTIAL_RESULT_VERSION = 1  # Bump when the layout of the --shard partial result files changes
+
+
+def select_shard(checker, file_paths):
+    """
+    Keep the files of the shard selected by `checker.shard` out of all discovered files.
+
+    Every shard discovers the same files and computes the same assignment without
+    talking to the others: files are taken from the heaviest to the lightest, weighted
+    by their size up to the header window of their job (the bytes a check reads, none
+    for ignored files), with ties broken by a stable hash of the path, and each one goes
+    to the shard with the least weight so far, so that all shards finish together.
+
+    Args:
+        checker (LicenseChecker): Checker running on the shard, its `shard_summary` is set.
+        file_paths (Iterable[str]): All discovered files.
+
+    Returns:
+        list[str]: Files of this shard, in discovery order.
+    """
+    shard_index, shard_count = checker.shard
+    weighted_files = []
+    for order, file_path in enumerate(file_paths):
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            size = 0
+        job_config = checker.get_config(checker.config, file_path)
+        if job_config is None:
+            read_size = 0
+        else:
+            window_bytes = job_config.get(HEADER_WINDOW_BYTES, DEFAULT_HEADER_WINDOW_BYTES)
+            read_size = min(size, window_bytes) if window_bytes else size
+        path_hash = zlib.crc32(file_path.replace(os.sep, '/').encode('utf-8', 'surrogateescape'))
+        weighted_files.append((-(SHARD_FILE_COST_BYTES + read_size), path_hash, file_path, order))
+    weighted_files.sort()
+
+    shard_loads = [(0, index) for index in range(1, shard_count + 1)]  # Heap of (weight, shard index)
+    selected = []
+    weight = 0
+    for negative_weight, _, file_path, order in weighted_files:
+        load, index = heapq.heappop(shard_loads)
+        if index == shard_index:
+            selected.append((order, file_path))
+            weight -= negative_weight
+        heapq.heappush(shard_loads, (load - negative_weight, index))
+
+    checker.shard_summary = {'files': len(selected), 'total_files': len(weighted_files), 'weight': weight}
+    print_debug(f"Shard {shard_index}/{shard_count}: {len(selected)} of {len(weighted_files)} files")
+    return [file_path for _, file_path in sorted(selected)]
+
+
+def get_partial_result_path(shard):
+    """
+    Get the default partial result file of a shard.
+    """
+    return f"check-copyright-shard-{shard[0]}-of-{shard[1]}.json"
+
+
+def write_partial_result(output_path, checker, seconds):
+    """
+    Write the result of a --shard run, to be combined with `check-copyright merge`.
+
+    Args:
+        output_path (str): Partial result file.
+        checker (LicenseChecker): Checker that ran on the shard.
+        seconds (float): Wall time of the run.
+    """
+    shard_index, shard_count = checker.shard
+    summary = checker.shard_summary or {'files': 0, 'total_files': 0, 'weight': 0}
+    partial = {
+        'version': PARTIAL_RESULT_VERSION,
+        'shard': shard_index,
+        'shard_count': shard_count,
+        'files': summary['files'],
+        'total_files': summary['total_files'],
+        'weight': summary['weight'],
+        'check_result': checker.check_result,
+        'invalid_license_files': sorted(checker.invalid_license_file_set),
+        'invalid_copyright_full': sorted(checker.invalid_copyright_full_set),
+        'invalid_copyright_short': sorted(checker.invalid_copyright_short_set),
+        'seconds': seconds,
+        'stats': checker.stats.to_dict() if checker.stats is not None else None,
+    }
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(partial, file, indent=2)
+    print_debug(f"Shard result written to {output_path}")
+
+
+def merge_partial_results(partial_paths, output_path = None):
+    """
+    Combine the partial results of all shards into the final report.
+
+    Args:
+        partial_paths (List[str]): Partial result files written by --shard.
+        output_path (str): File to write the merged result to as JSON, None to only print it.
+
+    Returns:
+        int: Exit code, 0 if all shards are present and all files have the correct license format.
+    """
+    partials = {}
+    shard_counts = set()
+    for partial_path in partial_paths:
+        try:
+            with open(partial_path, 'r', encoding='utf-8') as file:
+                partial = json.load(file)
+        except (OSError, ValueError) as e:
+            print_error(f"Cannot read the shard result {partial_path}: {e}")
+            return 1
+        if partial.get('version') != PARTIAL_RESULT_VERSION:
+            print_error(f"{partial_path} was written by an incompatible version of the checker")
+            return 1
+        if partial['shard'] in partials:
+            print_error(f"{partial_path} repeats the result of shard {partial['shard']}/{partial['shard_count']}")
+            return 1
+        partials[partial['shard']] = partial
+        shard_counts.add(partial['shard_count'])
+
+    if len(shard_counts) != 1:
+        print_error(f"The shard results come from runs with different shard counts: {', '.join(map(str, sorted(shard_counts)))}")
+        return 1
+    shard_count = shard_counts.pop()
+    missing_shards = [index for index in range(1, shard_count + 1) if index not in partials]
+
+    merged = {'shard_count': shard_count, 'missing_shards': missing_shards, 'files': 0, 'check_result': not missing_shards}
+    for key in ('invalid_license_files', 'invalid_copyright_full', 'invalid_copyright_short'):
+        merged[key] = sorted(set().union(*(partial[key] for partial in partials.values())))
+    for partial in partials.values():
+        merged['files'] += partial['files']
+        merged['check_result'] = merged['check_result'] and partial['check_result']
+    merged['seconds'] = {str(index): partials[index]['seconds'] for index in sorted(partials)}
+
+    if merged['invalid_license_files']:
+        print_error("The following files need to be formatted according to the LICENSE file template:")
+        for file_path in merged['invalid_license_files']:
+            print_info(f" - {file_path}")
+    if merged['invalid_copyright_full']:
+        print_error(f"The following files need to be formatted according to the {ESPRESSIF_COPYRIGHT_FULL} template:")
+        for file_path in merged['invalid_copyright_full']:
+            print_info(f" - {file_path}")
+    if merged['invalid_copyright_short']:
+        print_error(f"The following files need to be formatted according to the {ESPRESSIF_COPYRIGHT_SHORT} template:")
+        for file_path in merged['invalid_copyright_short']:
+            print_info(f" - {file_path}")
+
+    seconds = merged['seconds'].values()
+    print_debug(f"Merged {len(partials)} shards: {merged['files']} files, slowest shard {max(seconds):.2f}s, fastest {min(seconds):.2f}s")
+    if missing_shards:
+        print_error(f"Missing the results of shards {', '.join(map(str, missing_shards))} of {shard_count}.")
+    elif merged['check_result']:
+        print_info("Good job! All files have the correct license format.")
+    else:
+        print_warning("Some files do not have the correct license format, run the checker on them for the expected format.")
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump(merged, file, indent=2)
+
+    return 0 if merged['check_result'] else 1
+
+
+def merge_main(argv):
+    """
+    Entry point of `check-copyright merge`.
+
+    Args:
+        argv (List[str]): Arguments following the subcommand.
+
+    Returns:
+        int: Exit code.
+    """
+    parser = argparse.ArgumentParser(prog = 'check-copyright merge', description="Combine the partial results of --shard runs into the final report.")
+    parser.add_argument(
+        '--output',
+        type = str,
+        help = 'Also write the merged result as JSON to this file'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action = 'count',
+        default = 1,
+        help="Increase the log verbosity, use -v, -vv, etc. to set"
+    )
+    parser.add_argument('partial', nargs = '+', help = "Partial result files written by --shard")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level = LOG_LEVELS[min(args.verbose, 2)],  # Limit the maximum log level to DEBUG
+        format = '%(message)s'
+    )
+    return merge_partial_results(args.partial, args.output)
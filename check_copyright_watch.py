@@ -0,0 +1,224 @@
+"""
+Filesystem watchers of `check-copyright --watch`: inotify on Linux, stat snapshots elsewhere.
+"""
+import os
+import time
+import struct
+import select
+import ctypes
+
+from check_copyright import print_debug, print_warning, walk_tree
+
+
+WATCH_POLL_INTERVAL_SECONDS = 1.0  # With --watch, seconds between stat snapshots when inotify is unavailable
+INOTIFY_BUFFER_SIZE = 65536  # Bytes of inotify events read at a time
+
+
+class InotifyWatcher:
+    """
+    Report the paths changed under a set of directories, using Linux inotify through ctypes.
+
+    Every directory of the watched trees gets a watch. Directories created later are
+    watched as soon as they appear and reported themselves, since files may have been
+    written to them before their watch was added.
+    """
+    # Event bits from <sys/inotify.h>
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+    def __init__(self, roots, files, is_ignored_dir, is_relevant):
+        """
+        Args:
+            roots (list[str]): Directories watched recursively.
+            files (list[str]): Single files watched through their parent directory.
+            is_ignored_dir (Callable[[str], bool]): Whether a directory is left out.
+            is_relevant (Callable[[str], bool]): Whether changes of a file are reported.
+
+        Raises:
+            OSError: inotify is unavailable or out of watches.
+            AttributeError: The C library has no inotify functions.
+        """
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.get_errno = ctypes.get_errno
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor -> (directory, whether its sub-directories are watched)
+        self.files = set(files)
+        self.is_ignored_dir = is_ignored_dir
+        self.is_relevant = is_relevant
+        try:
+            for root in roots:
+                self.add_tree(root)
+            for file_path in files:
+                self.add_watch(os.path.dirname(file_path) or '.', False)
+        except OSError:
+            self.close()
+            raise
+
+
+    def add_watch(self, directory, recursive):
+        """
+        Watch the entries directly inside a directory.
+        """
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if watch < 0:
+            error = self.get_errno()
+            raise OSError(error, f"Cannot watch {directory}: {os.strerror(error)}")
+        # Watching a directory twice returns the same descriptor
+        recursive = recursive or self.watches.get(watch, (None, False))[1]
+        self.watches[watch] = (directory, recursive)
+
+
+    def add_tree(self, root):
+        """
+        Watch every directory of a tree that is not ignored.
+        """
+        for directory, _ in walk_tree(root, self.is_ignored_dir):
+            self.add_watch(directory, True)
+
+
+    def read_changes(self, timeout):
+        """
+        Wait for filesystem events.
+
+        Args:
+            timeout (float): Seconds to wait, None to wait until something changes.
+
+        Returns:
+            set[str]: Changed files and new directories, empty if nothing changed in time.
+        """
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, INOTIFY_BUFFER_SIZE)
+        changed = set()
+        offset = 0
+        # Each event is "int wd; uint32 mask, cookie, len; char name[len]"
+        while offset < len(data):
+            watch, mask, _, name_length = struct.unpack_from('iIII', data, offset)
+            offset += struct.calcsize('iIII')
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost, everything may have changed
+                changed.update(directory for directory, recursive in self.watches.values() if recursive)
+                changed.update(self.files)
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(watch, None)
+                continue
+            if watch not in self.watches:
+                continue
+
+            directory, recursive = self.watches[watch]
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO) and not self.is_ignored_dir(path):
+                    try:
+                        self.add_tree(path)
+                    except OSError as e:
+                        print_warning(f"{e}, changes below it are not noticed")
+                    changed.add(path)
+            elif (recursive or path in self.files) and self.is_relevant(path):
+                changed.add(path)
+        return changed
+
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Report the paths changed under a set of directories by comparing stat snapshots.
+    """
+    def __init__(self, roots, files, is_ignored_dir, is_relevant, interval = WATCH_POLL_INTERVAL_SECONDS):
+        """
+        Args:
+            roots (list[str]): Directories watched recursively.
+            files (list[str]): Single files to watch.
+            is_ignored_dir (Callable[[str], bool]): Whether a directory is left out.
+            is_relevant (Callable[[str], bool]): Whether changes of a file are reported.
+            interval (float): Seconds between snapshots.
+        """
+        self.roots = roots
+        self.files = files
+        self.is_ignored_dir = is_ignored_dir
+        self.is_relevant = is_relevant
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+
+    def take_snapshot(self):
+        """
+        Get the size, modification time and inode of every relevant file.
+
+        Returns:
+            dict: File path -> (size, mtime_ns, inode).
+        """
+        snapshot = {}
+        for root in self.roots:
+            for _, file_entries in walk_tree(root, self.is_ignored_dir):
+                for entry in file_entries:
+                    if self.is_relevant(entry.path):
+                        try:
+                            file_stat = entry.stat()
+                        except OSError:
+                            continue
+                        snapshot[entry.path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+        for file_path in self.files:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+        return snapshot
+
+
+    def read_changes(self, timeout):
+        """
+        Compare a new snapshot with the previous one.
+
+        Args:
+            timeout (float): Maximum seconds to wait before the snapshot, None for the polling interval.
+
+        Returns:
+            set[str]: Files added, modified or removed since the previous snapshot.
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot = self.take_snapshot()
+        changed = {file_path for file_path in snapshot.keys() | self.snapshot.keys() if snapshot.get(file_path) != self.snapshot.get(file_path)}
+        self.snapshot = snapshot
+        return changed
+
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots, files, is_ignored_dir, is_relevant):
+    """
+    Watch files with inotify where available, otherwise by polling stat snapshots.
+
+    Returns:
+        InotifyWatcher or PollingWatcher: The watcher.
+    """
+    try:
+        return InotifyWatcher(roots, files, is_ignored_dir, is_relevant)
+    except (OSError, AttributeError) as e:
+        print_debug(f"inotify is unavailable ({e}), polling for changes instead.")
+        return PollingWatcher(roots, files, is_ignored_dir, is_relevant)
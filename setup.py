@@ -27,7 +27,7 @@ setuptools.setup(
     author_email=EMAIL,
     url=URL,
     install_requires=REQUIRES,
-    py_modules=['check_copyright'],
+    py_modules=['check_copyright', 'check_copyright_client', 'check_copyright_index', 'check_copyright_report', 'check_copyright_server', 'check_copyright_shard', 'check_copyright_watch'],
     scripts=['check_copyright.py'],
-    entry_points={'console_scripts': ['check-copyright=check_copyright:main']},
+    entry_points={'console_scripts': ['check-copyright=check_copyright_client:main']},
 )
@@ -0,0 +1,151 @@
+"""
+The result cache and the license index must never let a verdict survive a change it depends on.
+
+Every test builds a small Git repository, fills the cache and the index, changes one
+input, and compares a cached run with a run that checks every file again.
+"""
+import os
+import sys
+import json
+import shutil
+import subprocess
+import time
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'check_copyright.py')
+CONFIG_NAME = 'check_copyright_config.yaml'
+AGE_SECONDS = 60  # Files are dated this far back, out of reach of the racy-file guard of the result cache
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com', GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+
+
+def git(repo, *args):
+    subprocess.run(['git'] + list(args), cwd=repo, env=GIT_ENV, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_check(repo, *args, cache=True):
+    """
+    Check the repository and return the exit code and the report record of every file, by path.
+    """
+    command = [sys.executable, SCRIPT, '--config', CONFIG_NAME, '--format', 'jsonl', '--no-daemon', '-j', '1']
+    if not cache:
+        command.append('--no-cache')
+    result = subprocess.run(command + list(args) + ['.'], cwd=repo, env=GIT_ENV, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    records = [json.loads(line) for line in result.stdout.decode().splitlines()]
+    return result.returncode, {record['path']: record for record in records if record['type'] == 'file'}
+
+
+def age_tree(repo):
+    """
+    Date every file and directory of the working tree back by `AGE_SECONDS`.
+    """
+    past = time.time() - AGE_SECONDS
+    for directory, dir_names, file_names in os.walk(repo):
+        dir_names[:] = [name for name in dir_names if name != '.git']
+        for name in file_names:
+            os.utime(os.path.join(directory, name), (past, past))
+        os.utime(directory, (past, past))
+
+
+def assert_same_as_uncached(repo):
+    """
+    Check that a cached run reports exactly what a run checking every file reports, and return its records.
+    """
+    exit_code, records = run_check(repo)
+    fresh_exit_code, fresh_records = run_check(repo, cache=False)
+    # Records of cached files do not repeat the license found in the header
+    strip = lambda records: {path: [record[key] for key in ('result', 'job', 'template', 'reason')] for path, record in records.items()}
+    assert (exit_code, strip(records)) == (fresh_exit_code, strip(fresh_records))
+    return exit_code, records
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """
+    Repository with `comp/a.c` held to the short template by `comp/LICENSE`, and `other/b.c`
+    held to the full template, committed, indexed, and with every file in the result cache.
+    """
+    shutil.copy(os.path.join(ROOT, CONFIG_NAME), tmp_path / CONFIG_NAME)
+    (tmp_path / 'comp').mkdir()
+    (tmp_path / 'other').mkdir()
+    (tmp_path / 'comp' / 'LICENSE').write_text("Espressif Modified MIT License\n")
+    (tmp_path / 'comp' / 'a.c').write_text("int a;\n")
+    (tmp_path / 'other' / 'b.c').write_text("int b;\n")
+    git(tmp_path, 'init', '-q')
+    # --replace writes the LICENSE template and the declarations
+    run_check(tmp_path, '--replace', cache=False)
+    git(tmp_path, 'add', '-A')
+    git(tmp_path, 'commit', '-q', '-m', 'Initial commit')
+    age_tree(tmp_path)
+
+    subprocess.run([sys.executable, SCRIPT, 'index', '--config', CONFIG_NAME], cwd=tmp_path, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    assert os.path.isfile(tmp_path / '.git' / 'check-copyright-cache' / 'license-index.json')
+    assert run_check(tmp_path)[0] == 0
+    exit_code, records = run_check(tmp_path)
+    assert exit_code == 0
+    assert records['./comp/a.c']['template'] == 'short' and records['./other/b.c']['template'] == 'full'
+    assert all(record['cached'] for record in records.values())
+    return tmp_path
+
+
+def test_removing_license(repo):
+    os.remove(repo / 'comp' / 'LICENSE')
+    exit_code, records = assert_same_as_uncached(repo)
+    assert exit_code == 1
+    assert records['./comp/a.c']['result'] == 'fail' and not records['./comp/a.c']['cached']
+
+
+def test_editing_license_in_place(repo):
+    # Same size, and the directory keeps its modification time: only the LICENSE status changes
+    license_path = repo / 'comp' / 'LICENSE'
+    text = license_path.read_text()
+    with open(license_path, 'r+') as license_file:
+        license_file.write(text.replace('Permission', 'Permissiox', 1))
+    assert_same_as_uncached(repo)
+    assert run_check(repo)[0] == 1
+
+
+def test_adding_license(repo):
+    shutil.copy(repo / 'comp' / 'LICENSE', repo / 'other' / 'LICENSE')
+    _, records = assert_same_as_uncached(repo)
+    assert records['./other/b.c']['template'] == 'short' and not records['./other/b.c']['cached']
+
+
+def test_changing_config(repo):
+    config_path = repo / CONFIG_NAME
+    config = config_path.read_text()
+    assert 'See LICENSE file for details.' in config
+    config_path.write_text(config.replace('See LICENSE file for details.', 'See the LICENSE file for details.'))
+    exit_code, records = assert_same_as_uncached(repo)
+    assert exit_code == 1
+    assert records['./comp/a.c']['result'] == 'fail' and not records['./comp/a.c']['cached']
+
+
+def test_moving_head(repo):
+    # The branch drops comp/LICENSE; the directory gets its old modification time back,
+    # so only the new HEAD tree tells the index that the directory changed
+    comp_stat = os.stat(repo / 'comp')
+    git(repo, 'checkout', '-q', '-b', 'without-license')
+    git(repo, 'rm', '-q', 'comp/LICENSE')
+    git(repo, 'commit', '-q', '-m', 'Remove the LICENSE')
+    os.utime(repo / 'comp', ns=(comp_stat.st_atime_ns, comp_stat.st_mtime_ns))
+    exit_code, records = assert_same_as_uncached(repo)
+    assert exit_code == 1
+    assert records['./comp/a.c']['result'] == 'fail'
+
+    git(repo, 'checkout', '-q', '-')
+    os.utime(repo / 'comp', ns=(comp_stat.st_atime_ns, comp_stat.st_mtime_ns))
+    exit_code, _ = assert_same_as_uncached(repo)
+    assert exit_code == 0
+
+
+def test_recently_modified_file_not_cached(repo):
+    a_path = repo / 'comp' / 'a.c'
+    a_path.write_bytes(a_path.read_bytes())
+    run_check(repo)
+    assert not run_check(repo)[1]['./comp/a.c']['cached']
+    age_tree(repo)
+    run_check(repo)
+    assert run_check(repo)[1]['./comp/a.c']['cached']